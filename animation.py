@@ -0,0 +1,86 @@
+"""Анимация перелета карт по времени.
+
+Animator хранит перелеты карт: откуда, куда, когда начать и сколько
+длиться. Положение карты считается по прошедшему времени, а не по числу
+кадров, поэтому скорость анимации не зависит от частоты кадров, а
+пропущенные кадры ее не замедляют. Позиция партии меняется сразу, экран
+догоняет ее: пока карта летит, интерфейс не рисует ее на новом месте.
+
+Модуль не зависит от pygame: позиции - пары координат экрана.
+"""
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+Point = Tuple[int, int]
+
+# Длительность перелета при ходе, с
+MOVE_DURATION = 0.18
+
+
+def ease_out(t: float) -> float:
+    """Замедление к концу перелета (кубическое)."""
+    return 1 - (1 - t) ** 3
+
+
+def linear(t: float) -> float:
+    return t
+
+
+class Flight(NamedTuple):
+    """Перелет карты."""
+    card: int
+    face_up: bool
+    start: Point
+    end: Point
+    begin: float      # время начала (до него карта ждет в start)
+    duration: float
+    lift: float       # высота дуги над прямой start-end, пикселей
+    ease: Callable[[float], float]
+
+
+class Animator:
+    """Перелеты карт по времени: не больше одного на карту."""
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        # Карта -> ее перелет; словарь не пересоздается, интерфейс хранит ссылку на него
+        self.flights: Dict[int, Flight] = {}
+
+    def add(self, card: int, face_up: bool, start: Point, end: Point, delay: float = 0.0,
+            duration: float = MOVE_DURATION, lift: float = 0.0,
+            ease: Callable[[float], float] = ease_out, now: Optional[float] = None) -> None:
+        """Запускает перелет карты (прежний перелет той же карты отменяется)."""
+        begin = (self.clock() if now is None else now) + delay
+        self.flights[card] = Flight(card, face_up, start, end, begin, duration, lift, ease)
+
+    def position(self, card: int, now: float) -> Optional[Point]:
+        """Текущее положение летящей карты или None, если она не летит."""
+        flight = self.flights.get(card)
+        return self._position(flight, now) if flight else None
+
+    @staticmethod
+    def _position(flight: Flight, now: float) -> Point:
+        t = min(max((now - flight.begin) / flight.duration, 0.0), 1.0)
+        k = flight.ease(t)
+        (x0, y0), (x1, y1) = flight.start, flight.end
+        return (round(x0 + (x1 - x0) * k),
+                round(y0 + (y1 - y0) * k - flight.lift * 4 * t * (1 - t)))
+
+    def frame(self, now: Optional[float] = None) -> List[Tuple[int, bool, Point]]:
+        """Карты в полете на момент now: карта, лицом вверх, положение.
+
+        Закончившиеся перелеты удаляются: карты снова рисуются на своих местах.
+        """
+        if not self.flights:
+            return []
+        now = self.clock() if now is None else now
+        finished = [card for card, flight in self.flights.items()
+                    if now >= flight.begin + flight.duration]
+        for card in finished:
+            del self.flights[card]
+        return [(card, flight.face_up, self._position(flight, now))
+                for card, flight in self.flights.items()]
+
+    def clear(self) -> None:
+        """Прекращает все перелеты."""
+        self.flights.clear()
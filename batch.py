@@ -0,0 +1,370 @@
+"""Пакетный движок: N независимых партий, которые ходят одновременно.
+
+Состояния партий хранятся массивами NumPy, а допустимые ходы и их
+применение считаются сразу для всех партий векторными операциями. Модуль
+нужен для оценки стратегий на тысячах партий; правила те же, что у
+engine.Game, что проверяется сверкой с ним (команда check).
+
+Состояние N партий:
+    tableau      (N, 7, DEPTH) uint8 - карты стопок сверху вниз, NO_CARD - пусто
+    length       (N, 7) int8         - число карт в стопке
+    hidden       (N, 7) int8         - число закрытых карт
+    foundations  (N, 4) uint8        - число карт в фундаменте каждой масти
+    talon        (N, TALON) uint8    - сток и отбой одной цепочкой в порядке
+                                       сдачи: отбой снизу вверх, затем сток
+                                       сверху вниз
+    talon_len    (N,) int8           - карт в стоке и отбое
+    pointer      (N,) int8           - число карт в отбое (указатель сдачи)
+
+Ходы нумеруются по таблице ACTIONS: сдача, ходы в фундамент из каждой
+стопки-источника, перекладывания count карт из стопки tableau src в dst и
+карты из отбоя в tableau. legal_mask возвращает маску (N, len(ACTIONS)),
+apply применяет по одному ходу в каждой партии.
+
+Запуск:
+    python batch.py check --games 500 --moves 400
+    python batch.py run --games 10000 --moves 500
+
+Требуется numpy; остальные модули от него не зависят.
+"""
+import argparse
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from engine import (Game, Move, Pile, DEAL, DECK_SIZE, FOUNDATION, KING, RANKS, SOURCES, STOCK,
+                    SUITS, WASTE, CARD_RANK, CARD_RED, CARD_SUIT, shuffled_deck)
+
+# Пустая ячейка стопки и отсутствующая карта (вместо верхней карты пустой стопки)
+NO_CARD = DECK_SIZE
+
+# Наибольшая длина стопки tableau: 6 закрытых карт и серия от короля до туза
+DEPTH = 6 + len(RANKS)
+
+# Карт в стоке и отбое после раздачи
+TALON = DECK_SIZE - 28
+
+# Масть и ранг карты; у NO_CARD ранг, которого не бывает в фундаменте
+SUIT_OF = np.frombuffer(CARD_SUIT + b'\0', np.uint8).astype(np.intp)
+RANK_OF = np.frombuffer(CARD_RANK + b'\xff', np.uint8)
+
+# Ключ карты для ходов в tableau - ранг * 2 + цвет: на карту top ложится
+# карта с ключом NEED_KEY[top] (ранг на 1 меньше, другой цвет), на пустую
+# стопку (top == NO_CARD) - короли с ключами NEED_KEY и NEED_KEY_2. NO_KEY -
+# ключ отсутствующей карты, NO_MATCH - ключ, которого нет ни у одной карты
+NO_KEY = 2 * len(RANKS)
+NO_MATCH = NO_KEY + 1
+KEY_OF = np.array([CARD_RANK[card] * 2 + CARD_RED[card] for card in range(DECK_SIZE)] + [NO_KEY],
+                  np.intp)
+NEED_KEY = np.array([(CARD_RANK[top] - 1) * 2 + 1 - CARD_RED[top] if CARD_RANK[top] else NO_MATCH
+                     for top in range(DECK_SIZE)] + [KING * 2], np.intp)
+NEED_KEY_2 = np.array([NO_MATCH] * DECK_SIZE + [KING * 2 + 1], np.intp)
+
+# Таблица ходов: номер хода в маске -> Move
+ACTIONS: List[Move] = (
+    [DEAL] +
+    [Move(src, 1, FOUNDATION) for src in SOURCES] +
+    [Move(src, count, dst) for src in range(7) for count in range(1, len(RANKS) + 1)
+     for dst in range(7)] +
+    [Move(WASTE, 1, dst) for dst in range(7)])
+ACTION_INDEX = {move: i for i, move in enumerate(ACTIONS)}
+FIRST_FOUNDATION = ACTION_INDEX[Move(0, 1, FOUNDATION)]
+FIRST_TABLEAU = ACTION_INDEX[Move(0, 1, 0)]
+FIRST_WASTE = ACTION_INDEX[Move(WASTE, 1, 0)]
+ACTION_SRC = np.array([move.src for move in ACTIONS], np.intp)
+ACTION_COUNT = np.array([move.count for move in ACTIONS], np.intp)
+ACTION_DST = np.array([move.dst for move in ACTIONS], np.intp)
+
+# Перекладывание стопки на саму себя недопустимо: маска (src, dst)
+_SAME_PILE = np.eye(7, dtype=bool)
+
+# Глубина карты от верха стопки для серий из 1..13 карт
+_RUN_DEPTH = np.arange(len(RANKS))
+_CELLS = np.arange(DEPTH)
+
+
+class BatchGame:
+    """Состояния N партий и векторное применение ходов."""
+
+    def __init__(self, count: int):
+        self.tableau = np.full((count, 7, DEPTH), NO_CARD, np.uint8)
+        self.length = np.zeros((count, 7), np.int8)
+        self.hidden = np.zeros((count, 7), np.int8)
+        self.foundations = np.zeros((count, len(SUITS)), np.uint8)
+        self.talon = np.full((count, TALON), NO_CARD, np.uint8)
+        self.talon_len = np.zeros(count, np.int8)
+        self.pointer = np.zeros(count, np.int8)
+
+    def __len__(self) -> int:
+        return len(self.length)
+
+    @classmethod
+    def from_games(cls, games: Sequence[Game]) -> 'BatchGame':
+        """Пакет из позиций скалярного движка."""
+        batch = cls(len(games))
+        for g, game in enumerate(games):
+            for i, pile in enumerate(game.tableau):
+                batch.tableau[g, i, :len(pile.cards)] = list(pile.cards[::-1])
+                batch.length[g, i] = len(pile.cards)
+                batch.hidden[g, i] = pile.hidden
+            talon = game.waste + game.stock[::-1]
+            batch.talon[g, :len(talon)] = list(talon)
+            batch.talon_len[g] = len(talon)
+            batch.pointer[g] = len(game.waste)
+            batch.foundations[g] = list(game.foundations)
+        return batch
+
+    @classmethod
+    def from_seeds(cls, seeds: Sequence[int]) -> 'BatchGame':
+        """Пакет начальных раздач по seed (см. engine.shuffled_deck)."""
+        return cls.from_games([Game(shuffled_deck(seed)) for seed in seeds])
+
+    def game(self, g: int) -> Game:
+        """Позиция партии g для скалярного движка."""
+        game = Game.__new__(Game)
+        game.tableau = [Pile(self.tableau[g, i, :self.length[g, i]][::-1].tobytes(),
+                             int(self.hidden[g, i])) for i in range(7)]
+        talon = self.talon[g, :self.talon_len[g]].tobytes()
+        game.waste = bytearray(talon[:self.pointer[g]])
+        game.stock = bytearray(talon[self.pointer[g]:][::-1])
+        game.foundations = bytearray(self.foundations[g].tobytes())
+        game.reset_index()
+        game.rehash()
+        return game
+
+    def tops(self) -> np.ndarray:
+        """Верхние карты стопок tableau (N, 7); NO_CARD у пустых стопок."""
+        return self.tableau[:, :, 0]
+
+    def waste_top(self) -> np.ndarray:
+        """Верхние карты отбоя (N,); NO_CARD, если отбой пуст."""
+        pointer = self.pointer.astype(np.intp)
+        top = self.talon[np.arange(len(self)), np.maximum(pointer - 1, 0)]
+        return np.where(pointer > 0, top, NO_CARD)
+
+    def legal_mask(self) -> np.ndarray:
+        """Маска допустимых ходов (N, len(ACTIONS)).
+
+        Совпадает с правилами Game.can_move_to_foundation и
+        Game.can_move_to_tableau и с множеством Game.legal_moves.
+        """
+        count = len(self)
+        top = self.tops()
+        waste_top = self.waste_top()
+        mask = np.zeros((count, len(ACTIONS)), bool)
+        mask[:, 0] = self.talon_len > 0
+
+        # В фундамент: верхняя карта отбоя или стопки - следующая в своей масти
+        sources = np.concatenate([top, waste_top[:, None]], axis=1)
+        rows = np.arange(count)[:, None]
+        mask[:, FIRST_FOUNDATION:FIRST_TABLEAU] = (
+            self.foundations[rows, SUIT_OF[sources]] == RANK_OF[sources])
+
+        # В tableau. Открытые карты стопки - убывающая серия чередующихся
+        # цветов, поэтому каждый ключ встречается в ней не больше раза:
+        # taken[g, src, key] - сколько карт берется вместе с картой key
+        # (0 - такой открытой карты нет)
+        run = KEY_OF[self.tableau[:, :, :len(RANKS)]]
+        run[_RUN_DEPTH >= (self.length - self.hidden)[:, :, None]] = NO_KEY
+        taken = np.zeros(count * 7 * (NO_MATCH + 1), np.int8)
+        base = np.arange(0, len(taken), NO_MATCH + 1).reshape(count, 7, 1)
+        taken[base + run] = _RUN_DEPTH + 1
+        moved = taken[base + NEED_KEY[top][:, None, :]] + taken[base + NEED_KEY_2[top][:, None, :]]
+        moved[:, _SAME_PILE] = 0
+        g, src, dst = np.nonzero(moved)
+        action = FIRST_TABLEAU + (src * len(RANKS) + moved[g, src, dst] - 1) * 7 + dst
+        mask[g, action] = True
+        waste_key = KEY_OF[waste_top][:, None]
+        mask[:, FIRST_WASTE:] = (waste_key == NEED_KEY[top]) | (waste_key == NEED_KEY_2[top])
+        return mask
+
+    def apply(self, actions: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Делает в каждой партии ход actions[g] (номер в ACTIONS, -1 - пропуск).
+
+        Недопустимые ходы пропускаются, как в Game.apply. mask - результат
+        legal_mask для текущих состояний, если он уже посчитан. Возвращает
+        маску партий, в которых ход сделан.
+        """
+        if mask is None:
+            mask = self.legal_mask()
+        actions = np.asarray(actions, np.intp)
+        action = np.maximum(actions, 0)
+        legal = (actions >= 0) & mask[np.arange(len(self)), action]
+        src = ACTION_SRC[action]
+        count = ACTION_COUNT[action]
+        dst = ACTION_DST[action]
+
+        # Сдача карты из стока; при пустом стоке отбой переворачивается
+        g = np.flatnonzero(legal & (src == STOCK))
+        self.pointer[g] = np.where(self.pointer[g] < self.talon_len[g], self.pointer[g] + 1, 0)
+
+        # Верхние карты отбоя, которые уходят в фундамент или tableau
+        from_waste = np.flatnonzero(legal & (src == WASTE))
+        waste_cards = self.waste_top()[from_waste]
+
+        # Стопки хранятся сверху вниз, поэтому снятие и добавление карт -
+        # сдвиг строк стопок на число карт хода. Верхние карты tableau в фундамент
+        g = np.flatnonzero(legal & (dst == FOUNDATION) & (src < WASTE))
+        s = src[g]
+        cards = self.tableau[g, s, 0]
+        self.tableau[g, s] = self.take(g, s, np.ones(len(g), np.intp))
+        self.length[g, s] -= 1
+        self.foundations[g, SUIT_OF[cards]] += 1
+        g = from_waste[dst[from_waste] == FOUNDATION]
+        self.foundations[g, SUIT_OF[waste_cards[dst[from_waste] == FOUNDATION]]] += 1
+
+        # Из отбоя в tableau
+        to_pile = dst[from_waste] < 7
+        g = from_waste[to_pile]
+        d = dst[g]
+        self.tableau[g, d] = self.put(g, d, waste_cards[to_pile][:, None], np.ones(len(g), np.intp))
+        self.length[g, d] += 1
+
+        # Серии из стопки в стопку
+        g = np.flatnonzero(legal & (src < WASTE) & (dst < 7))
+        s, d, n = src[g], dst[g], count[g]
+        run = self.tableau[g, s]
+        self.tableau[g, d] = self.put(g, d, run, n)
+        self.tableau[g, s] = self.take(g, s, n)
+        self.length[g, s] -= n.astype(np.int8)
+        self.length[g, d] += n.astype(np.int8)
+
+        # Карта уходит из отбоя: цепочка талона сдвигается на ее место
+        if len(from_waste):
+            talon = self.talon[from_waste]
+            position = np.arange(TALON)
+            removed = (self.pointer[from_waste] - 1).astype(np.intp)[:, None]
+            shift = np.minimum(position + (position >= removed), TALON - 1)
+            talon = np.take_along_axis(talon, shift, 1)
+            talon[np.arange(len(from_waste)), self.talon_len[from_waste] - 1] = NO_CARD
+            self.talon[from_waste] = talon
+            self.talon_len[from_waste] -= 1
+            self.pointer[from_waste] -= 1
+
+        # Открываем верхние карты стопок, с которых сняли все открытые карты
+        self.hidden -= (self.hidden > 0) & (self.hidden == self.length)
+        return legal
+
+    def take(self, g: np.ndarray, s: np.ndarray, n: np.ndarray) -> np.ndarray:
+        """Стопки s партий g без n верхних карт (строки tableau)."""
+        rows = np.concatenate([self.tableau[g, s], np.full((len(g), DEPTH), NO_CARD, np.uint8)], 1)
+        return np.take_along_axis(rows, _CELLS + n[:, None], 1)
+
+    def put(self, g: np.ndarray, d: np.ndarray, run: np.ndarray, n: np.ndarray) -> np.ndarray:
+        """Стопки d партий g с n верхними картами строк run сверху (строки tableau)."""
+        rows = np.concatenate([run, self.tableau[g, d]], 1)
+        cells = _CELLS[None, :] - n[:, None]
+        return np.take_along_axis(rows, np.where(cells < 0, _CELLS, run.shape[1] + cells), 1)
+
+    def won(self) -> np.ndarray:
+        """Маска выигранных партий."""
+        return self.foundations.sum(axis=1, dtype=np.intp) == DECK_SIZE
+
+
+def random_actions(mask: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Случайный допустимый ход в каждой партии; -1, если ходов нет."""
+    # Допустимых ходов в партии немного: выбираем среди номеров ненулевых
+    # элементов маски, сгруппированных по партиям
+    legal = np.flatnonzero(mask)
+    if not len(legal):
+        return np.full(len(mask), -1, np.intp)
+    per_game = np.bincount(legal // mask.shape[1], minlength=len(mask))
+    first = np.cumsum(per_game) - per_game
+    pick = first + (rng.random(len(mask)) * per_game).astype(np.intp)
+    return np.where(per_game > 0, legal[np.minimum(pick, len(legal) - 1)] % mask.shape[1], -1)
+
+
+def scalar_mask(game: Game) -> np.ndarray:
+    """Маска ходов партии по правилам скалярного движка (для сверки)."""
+    mask = np.zeros(len(ACTIONS), bool)
+    for i, (src, count, dst) in enumerate(ACTIONS):
+        if src == STOCK:
+            mask[i] = bool(game.stock or game.waste)
+        elif count > game.movable_count(src):
+            continue
+        elif dst == FOUNDATION:
+            mask[i] = game.can_move_to_foundation(game.top_cards(src)[-1])
+        else:
+            mask[i] = src != dst and game.can_move_to_tableau(game.top_cards(src)[-count], dst)
+    return mask
+
+
+def same_position(a: Game, b: Game) -> bool:
+    """Совпадают ли позиции: стопки, сток, отбой и фундаменты."""
+    return (a.stock == b.stock and a.waste == b.waste and a.foundations == b.foundations and
+            all(x.cards == y.cards and x.hidden == y.hidden
+                for x, y in zip(a.tableau, b.tableau)))
+
+
+def check(games: int, moves: int, seed: int = 0, noise: float = 0.1) -> List[str]:
+    """Сверяет пакетный движок со скалярным на случайных партиях.
+
+    Каждый ход сравниваются маски допустимых ходов с scalar_mask и
+    Game.legal_moves, затем в обоих движках делается один и тот же ход:
+    случайный допустимый, а с вероятностью noise - любой из ACTIONS, чтобы
+    проверить и отказ в недопустимых ходах. После хода сравниваются позиции
+    и ключи Game.key. Возвращает описания расхождений.
+    """
+    rng = np.random.default_rng(seed)
+    scalar = [Game(shuffled_deck(seed + g)) for g in range(games)]
+    batch = BatchGame.from_games(scalar)
+    errors: List[str] = []
+    for step in range(moves):
+        mask = batch.legal_mask()
+        for g, game in enumerate(scalar):
+            expected = scalar_mask(game)
+            legal = {ACTION_INDEX[move] for move in game.legal_moves()}
+            if not np.array_equal(mask[g], expected) or set(np.flatnonzero(mask[g])) != legal:
+                errors.append(f"game {g}, move {step}: legal moves differ")
+        actions = random_actions(mask, rng)
+        noisy = rng.random(games) < noise
+        actions[noisy] = rng.integers(len(ACTIONS), size=int(noisy.sum()))
+        applied = batch.apply(actions, mask)
+        for g, game in enumerate(scalar):
+            done = actions[g] >= 0 and game.apply(ACTIONS[actions[g]])
+            if done != applied[g]:
+                errors.append(f"game {g}, move {step}: {ACTIONS[actions[g]]} applied {done} "
+                              f"by engine, {applied[g]} by batch")
+            position = batch.game(g)
+            if not same_position(position, game) or position.key() != game.key():
+                errors.append(f"game {g}, move {step}: positions differ")
+        if len(errors) >= 20:
+            break
+    return errors
+
+
+def run(games: int, moves: int, seed: int = 0) -> None:
+    """Случайные партии пакетом: скорость и доля выигрышей."""
+    rng = np.random.default_rng(seed)
+    batch = BatchGame.from_seeds(range(seed, seed + games))
+    start = time.perf_counter()
+    played = 0
+    for _ in range(moves):
+        mask = batch.legal_mask()
+        actions = random_actions(mask, rng)
+        played += int(batch.apply(actions, mask).sum())
+    elapsed = time.perf_counter() - start
+    print(f"games {games}, moves {played}, {played / elapsed:.0f} moves/s, "
+          f"won {int(batch.won().sum())}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Пакетный движок 'Косынки'")
+    parser.add_argument('command', choices=('check', 'run'),
+                        help="check - сверка со скалярным движком, run - случайные партии")
+    parser.add_argument('--games', type=int, default=500, help="число партий в пакете")
+    parser.add_argument('--moves', type=int, default=400, help="ходов в каждой партии")
+    parser.add_argument('--seed', type=int, default=0, help="seed первого расклада")
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        run(args.games, args.moves, args.seed)
+        return
+    errors = check(args.games, args.moves, args.seed)
+    print('\n'.join(errors) or f"ok: {args.games} games x {args.moves} moves")
+    raise SystemExit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,823 @@
+"""Замеры производительности пасьянса.
+
+Запуск: python bench.py [имя_замера ...] [--json out.json] [--baseline base.json]
+Без аргументов выполняются все замеры. Окно не открывается: используется
+фиктивный видеодрайвер SDL. Результаты можно сохранить в JSON и сравнить с
+сохраненными ранее: ухудшения больше --threshold отмечаются, и код выхода
+становится 1.
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Callable, Dict
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+
+def measure(func: Callable[[], None], repeat: int) -> float:
+    """Среднее время одного вызова func в микросекундах."""
+    func()  # прогрев
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def bench_draw_game() -> Dict[str, float]:
+    """Время кадра draw_game: полная перерисовка, простой и перетаскивание."""
+    import main
+
+    random.seed(1)
+    game = main.Solitaire(animate=False)
+    for _ in range(10):
+        game.deal_from_stock()
+
+    def full_frame():
+        game.invalidate()
+        game.draw_game()
+
+    def drag_frame():
+        x, y = game.drag_pos
+        game.drag_pos = (x + 3, y + 2) if x < 700 else (300, 300)
+        game.draw_game()
+
+    results = {
+        'full_frame_us': measure(full_frame, 300),
+        'idle_frame_us': measure(game.draw_game, 300),
+    }
+    game.handle_click((main.MARGIN * 2 + main.CARD_WIDTH + 5, main.MARGIN + 5))
+    game.drag_pos = (300, 300)
+    results['drag_frame_us'] = measure(drag_frame, 300)
+    return results
+
+
+def bench_scale() -> Dict[str, float]:
+    """Стол при разных размерах окна: время кадров и смены размера окна."""
+    import pygame
+    import main
+
+    random.seed(1)
+    game = main.Solitaire(seed=1, animate=False)
+    for _ in range(10):
+        game.deal_from_stock()
+
+    def full_frame():
+        game.invalidate()
+        game.draw_game()
+
+    results = {}
+    for size in ((1000, 700), (2000, 1400), (3840, 2160)):
+        pygame.display.set_mode(size, pygame.RESIZABLE)
+        game.resize()
+        game.draw_game()
+        layout = main.layout
+        game.handle_click((layout.waste_pos[0] + 5, layout.waste_pos[1] + 5))
+        start = (size[0] // 3, size[1] // 3)
+        game.drag_pos = start
+
+        def drag_frame():
+            x, y = game.drag_pos
+            game.drag_pos = (x + 3, y + 2) if x < size[0] * 2 // 3 else start
+            game.draw_game()
+
+        prefix = f'{size[0]}x{size[1]}_'
+        results[prefix + 'full_frame_us'] = measure(full_frame, 50)
+        results[prefix + 'drag_frame_us'] = measure(drag_frame, 300)
+        game.clear_selection()
+
+    def resize(size):
+        pygame.display.set_mode(size, pygame.RESIZABLE)
+        game.resize()
+        game.draw_game()
+
+    # Новый масштаб: изображения карт строятся; прежний - берутся из кэша
+    sizes = [(1000 + 50 * k, 700 + 35 * k) for k in range(10)]
+    start = time.perf_counter()
+    for size in sizes:
+        resize(size)
+    results['resize_new_scale_ms'] = (time.perf_counter() - start) / len(sizes) * 1000
+    start = time.perf_counter()
+    for size in sizes:
+        resize(size)
+    results['resize_cached_ms'] = (time.perf_counter() - start) / len(sizes) * 1000
+    results['art_cache_bytes'] = sum(card_set.size for card_set in main.card_art.sets.values())
+    return results
+
+
+def bench_animation() -> Dict[str, float]:
+    """Анимация: кадры разлета всех 52 карт при выигрыше (цель - 60 кадров в секунду)."""
+    import main
+
+    game = main.Solitaire(seed=1)
+    clock = [0.0]
+    game.animator.clock = lambda: clock[0]
+
+    # Выигранная позиция: все карты в фундаментах
+    state = game.game
+    state.foundations[:] = bytes([len(main.RANKS)] * len(main.SUITS))
+    for pile in state.tableau:
+        pile.cards.clear()
+        pile.hidden = 0
+    state.stock.clear()
+    state.waste.clear()
+    state.reset_index()
+    state.rehash()
+
+    def cascade(stagger: float) -> Dict[str, float]:
+        """Кадры каскада по 1/60 с: среднее и худшее время, пик карт в полете."""
+        game.animator.clear()
+        game.invalidate()
+        game.draw_game()
+        game.win_cascade(stagger)
+        times = []
+        peak = 0
+        while game.flying:
+            clock[0] += 1 / 60
+            peak = max(peak, len(game.flying))
+            start = time.perf_counter()
+            game.draw_game()
+            times.append(time.perf_counter() - start)
+        return {'frame_us': sum(times) / len(times) * 1e6, 'frame_max_us': max(times) * 1e6,
+                'frames': len(times), 'peak_flying': peak}
+
+    results = {}
+    # Все карты летят одновременно - худший случай; и обычный каскад по очереди
+    for name, stagger in (('cascade_all', 0.0), ('cascade', main.CASCADE_STAGGER)):
+        stats = cascade(stagger)
+        results[name + '_frame_us'] = stats['frame_us']
+        results[name + '_frame_max_us'] = stats['frame_max_us']
+        results[name + '_frames_per_s'] = 1e6 / stats['frame_us']
+        if name == 'cascade_all':
+            results['cascade_all_peak_flying'] = stats['peak_flying']
+
+    # Раздача: 28 карт из стока по очереди
+    game.animator.clear()
+    game.new_game(1)
+    frames = []
+    while game.flying:
+        clock[0] += 1 / 60
+        start = time.perf_counter()
+        game.draw_game()
+        frames.append(time.perf_counter() - start)
+    results['deal_frame_us'] = sum(frames) / len(frames) * 1e6
+    return results
+
+
+def bench_hit_test() -> Dict[str, float]:
+    """Поиск объекта под курсором: движение мыши, клик и сброс карт."""
+    import main
+
+    random.seed(1)
+    game = main.Solitaire(animate=False)
+    rng = random.Random(1)
+    points = [(rng.randrange(main.SCREEN_WIDTH), rng.randrange(main.SCREEN_HEIGHT))
+              for _ in range(1000)]
+
+    def motion():
+        for pos in points:
+            game.get_card_at_pos(pos)
+
+    def click():
+        for pos in points:
+            if pos[1] > main.layout.tableau_y:  # без сдач из стока
+                game.handle_click(pos)
+            game.clear_selection()
+
+    def drop():
+        for pos in points:
+            game.selection = main.Selection(6, 1)
+            game.handle_drop(pos)
+
+    n = len(points)
+    return {
+        'get_card_at_pos_us': measure(motion, 20) / n,
+        'handle_click_us': measure(click, 20) / n,
+        'handle_drop_us': measure(drop, 20) / n,
+    }
+
+
+def bench_engine() -> Dict[str, float]:
+    """Импорт движка без pygame и случайная игра: ходы в секунду."""
+    code = ("import sys, time; t = time.perf_counter(); import engine; "
+            "print(time.perf_counter() - t, 'pygame' in sys.modules)")
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+    assert out[1] == 'False', "engine не должен импортировать pygame"
+
+    from engine import Game
+
+    rng = random.Random(1)
+    moves = 0
+    start = time.perf_counter()
+    for _ in range(200):
+        game = Game()
+        for _ in range(300):
+            legal = game.legal_moves()
+            if not legal:
+                break
+            game.apply(rng.choice(legal))
+            moves += 1
+    elapsed = time.perf_counter() - start
+
+    # Размер состояния партии: стопки и фундаменты (объекты Python) и его
+    # компактной записи Game.pack
+    state_bytes = (sum(sys.getsizeof(pile) + sys.getsizeof(pile.cards) for pile in game.tableau) +
+                   sys.getsizeof(game.stock) + sys.getsizeof(game.waste) +
+                   sys.getsizeof(game.foundations) + sys.getsizeof(game.tableau) + sys.getsizeof(game))
+    return {'import_ms': float(out[0]) * 1000, 'random_moves_per_s': moves / elapsed,
+            'state_bytes': state_bytes, 'packed_state_bytes': len(game.pack())}
+
+
+# Запуск игры до первого кадра: пустого сукна и стола с картами. QUIT
+# отправляется заранее, поэтому цикл выводит стол один раз и завершается.
+STARTUP_CODE = """
+import time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+pygame = main.pygame
+frames = []
+
+def frame(output):
+    def wrapper(*args):
+        output(*args)
+        frames.append(time.perf_counter())
+    return wrapper
+
+pygame.display.flip = frame(pygame.display.flip)
+pygame.display.update = frame(pygame.display.update)
+game = main.Solitaire(seed=1)
+pygame.event.post(pygame.event.Event(pygame.QUIT))
+game.run()
+print(imported - start, frames[0] - start, frames[1] - start)
+"""
+
+
+def bench_startup() -> Dict[str, float]:
+    """Запуск игры: импорт main, первый кадр (сукно) и первый кадр с картами, мс.
+
+    Медиана по нескольким запускам в отдельных процессах; время запуска
+    интерпретатора не входит.
+    """
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)  # замеряем с кэшем байт-кода, как у игрока
+    runs = []
+    for _ in range(6):
+        out = subprocess.run([sys.executable, '-c', STARTUP_CODE], capture_output=True,
+                             text=True, env=env, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()[-3:]
+        runs.append([float(value) * 1000 for value in out])
+    runs = runs[1:]  # первый запуск - прогрев кэша байт-кода и шрифтов
+    import_ms, first_frame_ms, table_frame_ms = (sorted(column)[len(runs) // 2]
+                                                 for column in zip(*runs))
+    return {'import_ms': import_ms, 'first_frame_ms': first_frame_ms,
+            'first_table_frame_ms': table_frame_ms}
+
+
+def bench_batch() -> Dict[str, float]:
+    """Пакетный движок NumPy против скалярного: случайные ходы в секунду."""
+    import numpy as np
+    import batch
+    from engine import Game, shuffled_deck
+
+    games, moves = 10000, 100
+    rng = np.random.default_rng(1)
+    state = batch.BatchGame.from_seeds(range(games))
+    played = 0
+    mask_time = 0.0
+    start = time.perf_counter()
+    for _ in range(moves):
+        mask_start = time.perf_counter()
+        mask = state.legal_mask()
+        mask_time += time.perf_counter() - mask_start
+        played += int(state.apply(batch.random_actions(mask, rng), mask).sum())
+    elapsed = time.perf_counter() - start
+
+    scalar_rng = random.Random(1)
+    scalar_moves = 0
+    scalar_start = time.perf_counter()
+    for seed in range(games // 10):
+        game = Game(shuffled_deck(seed))
+        for _ in range(moves):
+            legal = game.legal_moves()
+            if not legal:
+                break
+            game.apply(scalar_rng.choice(legal))
+            scalar_moves += 1
+    scalar_elapsed = time.perf_counter() - scalar_start
+    return {'batch_moves_per_s': played / elapsed,
+            'scalar_moves_per_s': scalar_moves / scalar_elapsed,
+            'legal_mask_us': mask_time / moves / games * 1e6}
+
+
+def bench_undo() -> Dict[str, float]:
+    """Отмена и повтор хода в длинной партии и память журнала на ход."""
+    from engine import Game, History, shuffled_deck
+
+    # Первый расклад, где случайные ходы не заходят в тупик раньше 5000 ходов
+    rng = random.Random(1)
+    seed = 0
+    game = Game(shuffled_deck(seed))
+    history = History()
+    while len(history.done) < 5000:
+        legal = game.legal_moves()
+        if not legal:
+            seed += 1
+            game = Game(shuffled_deck(seed))
+            history = History()
+            continue
+        history.play(game, rng.choice(legal))
+
+    def undo_redo():
+        history.undo(game)
+        history.redo(game)
+
+    return {'undo_redo_us': measure(undo_redo, 20000),
+            'history_bytes_per_move': history.done.itemsize}
+
+
+def bench_replay() -> Dict[str, float]:
+    """Архив записей партий: размер записи и скорость проверки."""
+    import tempfile
+    import replay
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.slrp')
+        games = replay.record(0, 500, path)
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        validation = replay.validate(path, workers=1)
+        elapsed = time.perf_counter() - start
+    assert not validation.invalid
+    return {'bytes_per_move': size / validation.moves,
+            'validate_games_per_s': games / elapsed}
+
+
+def bench_deals() -> Dict[str, float]:
+    """Библиотека раскладов: открытие и выбор расклада в файле из миллиона записей."""
+    import tempfile
+    import deals
+
+    rng = random.Random(1)
+    groups = []
+    for group in range(len(deals.GROUPS)):
+        groups.append(b''.join(deals.RECORD.pack(rng.randrange(1 << 32), group, 200, 5000)
+                               for _ in range(200_000)))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.sldl')
+        deals.write_library(path, groups)
+        library = deals.DealLibrary(path)
+
+        def sample():
+            library.sample('hard', rng)
+
+        results = {'open_us': measure(lambda: deals.DealLibrary(path).close(), 200),
+                   'sample_us': measure(sample, 20000),
+                   'bytes_per_deal': deals.RECORD.size}
+        library.close()
+    return results
+
+
+def playout(game, moves: int, rng: random.Random):
+    """Делает moves случайных ходов, предпочитая продвигающие; возвращает game."""
+    from engine import STOCK
+
+    for _ in range(moves):
+        legal = game.legal_moves()
+        if not legal:
+            break
+        progress = [move for move in legal if move.src != STOCK and game.is_progress(move)]
+        game.apply(rng.choice(progress or legal))
+    return game
+
+
+def playout_positions(count: int, moves: int, seed: int = 1) -> list:
+    """Позиции после moves случайных ходов, предпочитающих продвигающие."""
+    from engine import Game
+
+    rng = random.Random(seed)
+    random.seed(seed)
+    return [playout(Game(), moves, rng) for _ in range(count)]
+
+
+@functools.lru_cache(maxsize=None)
+def fixture(name: str):
+    """Позиция-образец для замеров; строится детерминированно по seed.
+
+    opening - начальная раздача, midgame - 40 ходов в партии, long_columns -
+    позиция с самой длинной стопкой tableau среди случайных партий, near_win -
+    решение решателя без последних 12 ходов.
+    """
+    from engine import Game, shuffled_deck
+
+    if name == 'opening':
+        return Game(shuffled_deck(1))
+    if name == 'midgame':
+        return playout(Game(shuffled_deck(2)), 40, random.Random(2))
+    if name == 'long_columns':
+        rng = random.Random(3)
+        best = None
+        for seed in range(40):
+            game = Game(shuffled_deck(seed))
+            for _ in range(150):
+                playout(game, 1, rng)
+                longest = max(len(pile) for pile in game.tableau)
+                if best is None or longest > best[0]:
+                    best = (longest, game.copy())
+        return best[1]
+    if name == 'near_win':
+        from solver import Solver, SOLVED
+
+        game = Game(shuffled_deck(1))
+        result = Solver(max_nodes=50000, time_limit=float('inf')).solve(game)
+        assert result.status == SOLVED
+        for move in result.moves[:-12]:
+            game.apply(move)
+        return game
+    raise KeyError(name)
+
+
+FIXTURES = ('opening', 'midgame', 'long_columns', 'near_win')
+
+
+def bench_fixtures() -> Dict[str, float]:
+    """Отрисовка, правила и поиск под курсором на позициях-образцах.
+
+    Для каждой позиции: вывод одной карты при отрисовке tableau, полный
+    кадр draw_game, has_progress_move и legal_moves с пересчетом индекса,
+    ход на фундамент и в tableau (с отменой), клик и сброс карт в случайных
+    точках стола (успешные сбросы отменяются).
+    """
+    import main
+    from engine import FOUNDATION
+
+    random.seed(1)
+    app = main.Solitaire(seed=1, animate=False)
+    app.draw_game()  # изображения карт строятся при первом кадре
+    results = {}
+    for name in FIXTURES:
+        position = fixture(name)
+        app.game = position.copy()
+        app.history = main.History()
+        app.clear_selection()
+        app.state_changed()
+        game = app.game
+        cards = sum(len(pile) for pile in game.tableau)
+
+        def draw_tableau():
+            for i in range(len(game.tableau)):
+                app.draw_tableau_pile(i)
+
+        def full_frame():
+            app.invalidate()
+            app.draw_game()
+
+        def rules():
+            game.reset_index()
+            game.legal_moves()
+            game.has_progress_move()
+
+        prefix = name + '_'
+        results[prefix + 'card_blit_us'] = measure(draw_tableau, 200) / max(cards, 1)
+        results[prefix + 'full_frame_us'] = measure(full_frame, 100)
+        results[prefix + 'has_progress_move_us'] = measure(game.has_progress_move, 2000)
+        results[prefix + 'rules_rescan_us'] = measure(rules, 500)
+
+        legal = game.legal_moves()
+        for kind, moves in (('foundation', [m for m in legal if m.dst == FOUNDATION]),
+                            ('tableau', [m for m in legal if m.dst < 7])):
+            if not moves:
+                continue
+
+            def play_undo():
+                for move in moves:
+                    game.undo(game.play(move))
+
+            results[f'{prefix}move_to_{kind}_us'] = measure(play_undo, 500) / len(moves)
+
+        rng = random.Random(1)
+        points = [(rng.randrange(main.SCREEN_WIDTH),
+                   rng.randrange(main.layout.tableau_y, main.SCREEN_HEIGHT))
+                  for _ in range(500)]
+        sources = [i for i, pile in enumerate(game.tableau) if pile.cards]
+
+        def click():
+            for pos in points:
+                app.handle_click(pos)
+                app.clear_selection()
+
+        def drop():
+            for k, pos in enumerate(points):
+                app.selection = main.Selection(sources[k % len(sources)], 1)
+                app.handle_drop(pos)
+                if app.history.done:
+                    app.history.undo(game)
+
+        results[prefix + 'handle_click_us'] = measure(click, 20) / len(points)
+        if sources:
+            results[prefix + 'handle_drop_us'] = measure(drop, 20) / len(points)
+    app.hints.close()
+    return results
+
+
+def bench_legal_moves() -> Dict[str, float]:
+    """Индекс допустимых ходов: обновление после хода и полный пересчет."""
+    positions = playout_positions(200, 40)
+
+    def full_scan():
+        for game in positions:
+            game.reset_index()
+            game.legal_moves()
+
+    # Обновление индекса после хода: меняются только стопки хода
+    move_pairs = [(game, game.legal_moves()[0]) for game in positions]
+
+    def apply_only():
+        for game, move in move_pairs:
+            child = game.copy()
+            child.update_index()
+            child.apply(move)
+
+    def apply_and_update():
+        for game, move in move_pairs:
+            child = game.copy()
+            child.update_index()
+            child.apply(move)
+            child.legal_moves()
+
+    def progress():
+        for game in positions:
+            game.has_progress_move()
+
+    n = len(positions)
+    return {
+        'full_scan_us': measure(full_scan, 20) / n,
+        'update_after_move_us': (measure(apply_and_update, 20) - measure(apply_only, 20)) / n,
+        'has_progress_move_us': measure(progress, 20) / n,
+    }
+
+
+def bench_hash() -> Dict[str, float]:
+    """Ключи Зобриста: коллизии на позициях случайных партий и скорость.
+
+    Коллизия - один ключ у позиций с разным видом: для canonical_key это
+    стопки tableau без учета порядка и цепочка стока и отбоя, для key -
+    стопки по порядку, сток и отбой. Для младших 24 бит канонического ключа
+    приведено ожидаемое число коллизий случайных чисел.
+    """
+    from engine import Game, shuffled_deck
+    from solver import talon_sequence
+
+    rng = random.Random(1)
+    canonical: Dict[int, tuple] = {}
+    exact: Dict[int, tuple] = {}
+    collisions = exact_collisions = 0
+    positions = []
+    for seed in range(300):
+        game = Game(shuffled_deck(seed))
+        for _ in range(300):
+            legal = game.legal_moves()
+            if not legal:
+                break
+            game.apply(rng.choice(legal))
+            piles = tuple((bytes(pile.cards), pile.hidden) for pile in game.tableau)
+            state = (tuple(sorted(piles)), talon_sequence(game))
+            if canonical.setdefault(game.canonical_key(), state) != state:
+                collisions += 1
+            state = (piles, bytes(game.waste), bytes(game.stock))
+            if exact.setdefault(game.key(), state) != state:
+                exact_collisions += 1
+        positions.append(game)
+
+    n = len(canonical)
+    low_bits = 24
+    count = len(positions)
+    return {
+        'canonical_positions': n,
+        'exact_positions': len(exact),
+        'canonical_collisions': collisions,
+        'exact_collisions': exact_collisions,
+        'collisions_24_bit': n - len({key & ((1 << low_bits) - 1) for key in canonical}),
+        'expected_collisions_24_bit': n * (n - 1) / 2 / 2 ** low_bits,
+        'canonical_key_us':
+            measure(lambda: [game.canonical_key() for game in positions], 200) / count,
+        'key_us': measure(lambda: [game.key() for game in positions], 200) / count,
+        'rehash_us': measure(lambda: [game.rehash() for game in positions], 50) / count,
+    }
+
+
+def bench_server() -> Dict[str, float]:
+    """Сервер партий: ход без сети, нагрузочный тест через localhost, размер позиции."""
+    import asyncio
+    import tempfile
+    import server
+    from engine import Game, move_code, shuffled_deck
+    from profiler import percentile
+
+    with tempfile.TemporaryDirectory() as directory:
+        games = server.GameServer(os.path.join(directory, 'sessions'))
+        rng = random.Random(1)
+        requests = []
+        for seed in range(200):
+            _, session, _ = games.handle(server.OP_NEW, 0, seed)
+            game = Game(shuffled_deck(seed))
+            for _ in range(20):
+                move = rng.choice(game.legal_moves())
+                game.apply(move)
+                requests.append((session, move_code(move)))
+        start = time.perf_counter()
+        for session, code in requests:
+            games.handle(server.OP_MOVE, session, code)
+        handle_us = (time.perf_counter() - start) / len(requests) * 1e6
+        state_bytes = sum(len(state) for _, state in games.sessions.values()) / len(games.sessions)
+        games.close()
+
+    result = asyncio.run(server.load_embedded(1000, 20, 10, False, server.IDLE_TIMEOUT))
+    return {'handle_move_us': handle_us, 'state_bytes': state_bytes,
+            'load_moves_per_s': result.moves / result.elapsed,
+            'load_p99_ms': percentile(sorted(result.latencies), 0.99) / 1e6}
+
+
+def bench_profiler() -> Dict[str, float]:
+    """Цена замера фаз главного цикла за кадр: выключенного и включенного."""
+    from profiler import FrameProfiler, PHASES
+
+    def frame(profiler):
+        for phase in PHASES:
+            if profiler:
+                profiler.mark(phase)
+        if profiler:
+            profiler.end_frame(True)
+
+    profiler = FrameProfiler()
+    return {'disabled_frame_us': measure(lambda: frame(None), 100000),
+            'enabled_frame_us': measure(lambda: frame(profiler), 100000)}
+
+
+def bench_hint() -> Dict[str, float]:
+    """Подсказка в фоне: задержка ответа и кадр перетаскивания во время поиска."""
+    import threading
+    from engine import Game, shuffled_deck
+    from hint import HintService
+    import main
+
+    random.seed(1)
+    game = main.Solitaire(animate=False)
+    game.handle_click((main.MARGIN * 2 + main.CARD_WIDTH + 5, main.MARGIN + 5))
+    game.drag_pos = (300, 300)
+
+    def drag_frame():
+        x, y = game.drag_pos
+        game.drag_pos = (x + 3, y + 2) if x < 700 else (300, 300)
+        game.draw_game()
+
+    idle = measure(drag_frame, 300)
+
+    done = threading.Event()
+    service = HintService(lambda hint: done.set(), time_limit=2.0)
+    try:
+        # Запуск процесса поиска в замер не входит
+        service.request(Game(shuffled_deck(0)))
+        done.wait(30)
+        latency = 0.0
+        busy = []
+        seeds = range(1, 6)
+        for seed in seeds:
+            done.clear()
+            start = time.perf_counter()
+            service.request(Game(shuffled_deck(seed)))
+            while not done.is_set():
+                busy.append(measure(drag_frame, 20))
+            latency += time.perf_counter() - start
+    finally:
+        service.close()
+    return {'drag_frame_idle_us': idle,
+            'drag_frame_searching_us': sum(busy) / max(len(busy), 1),
+            'hint_latency_ms': latency / len(seeds) * 1000}
+
+
+def bench_solver() -> Dict[str, float]:
+    """Решатель: скорость перебора и доля решенных раскладов."""
+    from engine import Game, shuffled_deck
+    from solver import Solver, SOLVED
+
+    solver = Solver(max_nodes=20000, time_limit=10.0)
+    nodes = solved = 0
+    elapsed = 0.0
+    seeds = range(1, 11)
+    for seed in seeds:
+        result = solver.solve(Game(shuffled_deck(seed)))
+        nodes += result.nodes
+        elapsed += result.elapsed
+        solved += result.status == SOLVED
+    return {'nodes_per_s': nodes / elapsed, 'solved_share': solved / len(seeds)}
+
+
+BENCHMARKS = {
+    'draw_game': bench_draw_game,
+    'hit_test': bench_hit_test,
+    'scale': bench_scale,
+    'animation': bench_animation,
+    'engine': bench_engine,
+    'startup': bench_startup,
+    'legal_moves': bench_legal_moves,
+    'batch': bench_batch,
+    'undo': bench_undo,
+    'replay': bench_replay,
+    'deals': bench_deals,
+    'hash': bench_hash,
+    'hint': bench_hint,
+    'server': bench_server,
+    'profiler': bench_profiler,
+    'fixtures': bench_fixtures,
+    'solver': bench_solver,
+}
+
+
+# Направление улучшения по суффиксу имени замера; остальные замеры справочные
+LOWER_IS_BETTER = ('_us', '_ms', '_bytes', '_collisions')
+HIGHER_IS_BETTER = ('_per_s', '_share')
+
+
+def run(names) -> Dict[str, Dict[str, float]]:
+    """Выполняет замеры и печатает результаты; возвращает их по замерам."""
+    results = {}
+    for name in names or BENCHMARKS:
+        results[name] = BENCHMARKS[name]()
+        for key, value in results[name].items():
+            print(f"{name:20} {key:36} {value:12.2f}")
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            threshold: float) -> int:
+    """Печатает изменения относительно baseline; возвращает число ухудшений.
+
+    Ухудшение - изменение в худшую сторону больше чем на threshold (доля).
+    При нулевом baseline (например, число коллизий) ухудшение - любой рост
+    метрики, которая должна уменьшаться. Метрика из baseline, которой нет в
+    результатах выполненного замера, тоже считается ухудшением.
+    """
+    regressions = 0
+    for name, values in results.items():
+        base_values = baseline.get(name, {})
+        for key, value in values.items():
+            base = base_values.get(key)
+            if base is None:
+                continue
+            if base:
+                change = value / base - 1
+                shown = f"{change:+8.1%}"
+            else:
+                change = float('inf') if value > 0 else float('-inf') if value < 0 else 0.0
+                shown = f"{'from 0':>8}" if value else f"{0:+8.1%}"
+            if key.endswith(LOWER_IS_BETTER):
+                worse = change > threshold
+            elif key.endswith(HIGHER_IS_BETTER):
+                worse = -change > threshold
+            else:
+                worse = False
+            regressions += worse
+            mark = "  REGRESSION" if worse else ""
+            print(f"{name:20} {key:36} {base:12.2f} -> {value:12.2f} {shown}{mark}")
+        for key in sorted(base_values.keys() - values.keys()):
+            regressions += 1
+            print(f"{name:20} {key:36} {base_values[key]:12.2f} -> {'missing':>12}  REGRESSION")
+    return regressions
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Замеры производительности пасьянса")
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help="замеры (по умолчанию все): " + ', '.join(BENCHMARKS))
+    parser.add_argument('--json', help="записать результаты в JSON-файл")
+    parser.add_argument('--baseline', help="сравнить с результатами из JSON-файла")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="допустимое ухудшение относительно baseline (доля)")
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"неизвестные замеры: {', '.join(sorted(unknown))}")
+
+    results = run(args.names)
+    if args.json:
+        with open(args.json, 'w') as stream:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'results': results}, stream, indent=1)
+    if args.baseline:
+        with open(args.baseline) as stream:
+            baseline = json.load(stream)['results']
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        print(f"regressions: {regressions}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
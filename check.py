@@ -0,0 +1,182 @@
+"""Проверки согласованности движка и отрисовки на случайных партиях.
+
+    python check.py undo --games 200 --moves 600
+    python check.py draw --games 4 --moves 250
+
+undo - отмена и повтор ходов (History на записях delta) восстанавливают
+позицию, индекс ходов и хеши Зобриста в точности: после каждой отмены и
+повтора позиция сравнивается с запомненной, а legal_moves, key и
+canonical_key - с копией, построенной заново (reset_index и rehash).
+
+draw - перерисовка по областям (Solitaire.draw_game) дает тот же кадр, что
+и полная перерисовка: после каждого действия (клик, перетаскивание, отмена,
+перенос в фундамент, смена размера окна) кадр сравнивается с полностью
+перерисованным, с анимацией (часы подменяются) и без нее. Окно не
+открывается: используется фиктивный видеодрайвер SDL.
+
+Код выхода 1, если найдены расхождения.
+"""
+import argparse
+import os
+import random
+from typing import List, Optional, Tuple
+
+from engine import Game, History, shuffled_deck
+
+# Сколько расхождений собирать, прежде чем прекратить проверку
+MAX_ERRORS = 20
+
+Position = Tuple[bytes, bytes, bytes, Tuple[Tuple[bytes, int], ...]]
+
+
+def snapshot(game: Game) -> Position:
+    """Позиция партии: сток, отбой, фундаменты и стопки tableau."""
+    return (bytes(game.stock), bytes(game.waste), bytes(game.foundations),
+            tuple((bytes(pile.cards), pile.hidden) for pile in game.tableau))
+
+
+def compare(game: Game, expected: Position) -> List[str]:
+    """Расхождения партии с ожидаемой позицией и с копией, построенной заново."""
+    errors = []
+    if snapshot(game) != expected:
+        errors.append("position differs")
+    fresh = game.copy()  # копия строит индекс ходов заново
+    fresh.rehash()
+    if set(game.legal_moves()) != set(fresh.legal_moves()):
+        errors.append("legal moves differ")
+    if game.key() != fresh.key():
+        errors.append("key differs")
+    if game.canonical_key() != fresh.canonical_key():
+        errors.append("canonical key differs")
+    return errors
+
+
+def check_undo(games: int, moves: int, seed: int = 0, undo_share: float = 0.2,
+               redo_share: float = 0.1) -> List[str]:
+    """Случайные партии вперемешку с отменой и повтором ходов.
+
+    Доля действий undo_share - отмена, redo_share - повтор, остальные -
+    случайный допустимый ход. Возвращает описания расхождений.
+    """
+    errors: List[str] = []
+    for g in range(games):
+        rng = random.Random(seed + g)
+        game = Game(shuffled_deck(seed + g))
+        history = History()
+        # Позиции после каждого сделанного и каждого отмененного хода
+        done = [snapshot(game)]
+        undone: List[Position] = []
+        for step in range(moves):
+            r = rng.random()
+            if r < undo_share and history.done:
+                history.undo(game)
+                undone.append(done.pop())
+                action, expected = 'undo', done[-1]
+            elif r < undo_share + redo_share and history.undone:
+                history.redo(game)
+                done.append(undone.pop())
+                action, expected = 'redo', done[-1]
+            else:
+                legal = game.legal_moves()
+                if not legal:
+                    break
+                history.play(game, rng.choice(legal))
+                done.append(snapshot(game))
+                undone.clear()
+                continue
+            errors.extend(f"game {seed + g}, step {step}, {action}: {error}"
+                          for error in compare(game, expected))
+            if len(errors) >= MAX_ERRORS:
+                return errors
+    return errors
+
+
+def check_draw(games: int, moves: int, seed: int = 0) -> List[str]:
+    """Сравнивает кадры перерисовки по областям с полной перерисовкой.
+
+    Возвращает описания расхождений.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import main
+    pygame = main.pygame
+
+    errors: List[str] = []
+    sizes = ((1000, 700), (1500, 900), (640, 480))
+    for g in range(games):
+        for animate in (False, True):
+            rng = random.Random(seed + g)
+            random.seed(seed + g)
+            clock = [0.0]
+            solitaire = main.Solitaire(seed=seed + g, animate=animate)
+            if animate:
+                # Анимация по подставным часам: кадры воспроизводимы
+                solitaire.animator.clock = lambda: clock[0]
+                solitaire.new_game(seed + g)
+            solitaire.draw_game()
+            name = f"game {seed + g}{', animated' if animate else ''}"
+
+            def same_as_full(label: str) -> None:
+                solitaire.draw_game()
+                frame = pygame.image.tobytes(solitaire.screen, 'RGB')
+                solitaire.invalidate()
+                solitaire.draw_game()
+                if frame != pygame.image.tobytes(solitaire.screen, 'RGB'):
+                    errors.append(f"{name}, {label}: region redraw differs from full redraw")
+
+            for step in range(moves):
+                width, height = solitaire.screen.get_size()
+                r = rng.random()
+                if r < 0.05:
+                    solitaire.undo()
+                elif r < 0.1:
+                    solitaire.auto_move()
+                elif r < 0.12:
+                    pygame.display.set_mode(rng.choice(sizes), pygame.RESIZABLE)
+                    solitaire.resize()
+                else:
+                    solitaire.handle_click((rng.randrange(width), rng.randrange(height)))
+                    if solitaire.selection:
+                        solitaire.drag_pos = (rng.randrange(width), rng.randrange(height))
+                        solitaire.draw_game()
+                        solitaire.handle_drop((rng.randrange(width), rng.randrange(height)))
+                clock[0] += rng.uniform(0, 0.08)
+                same_as_full(f"step {step}")
+                if len(errors) >= MAX_ERRORS:
+                    return errors
+
+            if animate:
+                # Карты долетели: стол такой же, как без анимации
+                clock[0] += 10
+                solitaire.draw_game()
+                frame = pygame.image.tobytes(solitaire.screen, 'RGB')
+                solitaire.animator = None
+                solitaire.flying = {}
+                solitaire.invalidate()
+                solitaire.draw_game()
+                if frame != pygame.image.tobytes(solitaire.screen, 'RGB'):
+                    errors.append(f"{name}: table after animations differs from static one")
+            solitaire.hints.close()
+    return errors
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Проверки движка и отрисовки 'Косынки'")
+    parser.add_argument('command', choices=('undo', 'draw'),
+                        help="undo - отмена и повтор ходов, draw - перерисовка по областям")
+    parser.add_argument('--games', type=int, help="число партий (undo - 200, draw - 4)")
+    parser.add_argument('--moves', type=int, help="действий в партии (undo - 600, draw - 250)")
+    parser.add_argument('--seed', type=int, default=0, help="seed первого расклада")
+    args = parser.parse_args(argv)
+
+    if args.command == 'undo':
+        games, moves = args.games or 200, args.moves or 600
+        errors = check_undo(games, moves, args.seed)
+    else:
+        games, moves = args.games or 4, args.moves or 250
+        errors = check_draw(games, moves, args.seed)
+    print('\n'.join(errors) or f"ok: {games} games x {moves} moves")
+    raise SystemExit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""Библиотека раскладов, заранее проверенных решателем.
+
+Расклад задается seed (engine.shuffled_deck). Построитель решает диапазон
+раскладов в пуле процессов и раскладывает их по группам: решаемые по
+сложности (easy, medium, hard - по числу узлов, которые понадобились
+решателю), доказанно нерешаемые и нерешенные за бюджет узлов. Файл
+библиотеки - записи фиксированного размера, сгруппированные по группам:
+
+    заголовок: b'SLDL', версия (uint8), 3 байта выравнивания,
+               число записей каждой группы (5 x uint32)
+    запись: seed (uint32), группа (uint8), байт выравнивания,
+            длина решения (uint16), узлов решателя (uint32)
+
+Игра отображает файл в память (mmap) и читает только выбранную запись,
+поэтому случайный расклад нужной сложности выбирается сразу и не требует
+загрузки библиотеки.
+
+Запуск:
+    python deals.py build --seeds 0:100000 --out deals.sldl
+    python deals.py info deals.sldl
+    python main.py --deals deals.sldl --difficulty hard
+"""
+import argparse
+import mmap
+import random
+import struct
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from engine import Game, shuffled_deck
+from pool import parse_range, run_pool
+
+FILE_MAGIC = b'SLDL'
+FILE_VERSION = 1
+
+# Группы раскладов: решаемые по сложности, затем нерешаемые и нерешенные
+DIFFICULTIES = ('easy', 'medium', 'hard')
+GROUPS = (*DIFFICULTIES, 'unwinnable', 'unknown')
+UNWINNABLE_GROUP = GROUPS.index('unwinnable')
+UNKNOWN_GROUP = GROUPS.index('unknown')
+
+FILE_HEADER = struct.Struct(f'<4sB3x{len(GROUPS)}I')
+RECORD = struct.Struct('<IBxHI')
+
+# Границы сложности по числу узлов решателя: easy - меньше первой, hard -
+# не меньше второй
+DIFFICULTY_NODES = (1000, 10000)
+
+
+class Deal(NamedTuple):
+    """Запись библиотеки."""
+    seed: int
+    group: int   # номер в GROUPS
+    moves: int   # длина решения (0, если решения нет)
+    nodes: int   # узлов, рассмотренных решателем
+
+    @property
+    def group_name(self) -> str:
+        return GROUPS[self.group]
+
+
+def classify(seed: int, solver) -> Deal:
+    """Решает расклад и определяет его группу."""
+    from solver import SOLVED, UNWINNABLE
+
+    result = solver.solve(Game(shuffled_deck(seed)))
+    if result.status == SOLVED:
+        group = sum(result.nodes >= limit for limit in DIFFICULTY_NODES)
+    elif result.status == UNWINNABLE:
+        group = UNWINNABLE_GROUP
+    else:
+        group = UNKNOWN_GROUP
+    return Deal(seed, group, min(len(result.moves), 0xFFFF), min(result.nodes, 0xFFFFFFFF))
+
+
+def classify_chunk(start: int, count: int, max_nodes: int) -> List[bytes]:
+    """Записи раскладов start..start + count - 1 по группам (выполняется в процессе пула)."""
+    from solver import Solver
+
+    solver = Solver(max_nodes=max_nodes, time_limit=float('inf'))
+    groups = [bytearray() for _ in GROUPS]
+    for seed in range(start, start + count):
+        deal = classify(seed, solver)
+        groups[deal.group] += RECORD.pack(*deal)
+    return [bytes(data) for data in groups]
+
+
+def write_library(path: str, groups: Sequence[bytes]) -> None:
+    """Записывает файл библиотеки из записей, уже разложенных по группам."""
+    with open(path, 'wb') as stream:
+        stream.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION,
+                                      *(len(data) // RECORD.size for data in groups)))
+        for data in groups:
+            stream.write(data)
+
+
+def build(first: int, last: int, out: str, workers: Optional[int] = None,
+          chunk_size: int = 100, max_nodes: int = 20000, progress: bool = False) -> List[int]:
+    """Решает расклады first..last - 1 в пуле процессов и пишет библиотеку out.
+
+    Возвращает число раскладов в каждой группе.
+    """
+    chunks: Dict[int, List[bytes]] = {}
+
+    def report(elapsed: float) -> str:
+        solved = sum(len(data) for groups in chunks.values() for data in groups)
+        solved //= RECORD.size
+        return f"deals {solved}, {solved / elapsed:.1f} deals/s"
+
+    tasks = ((start, min(chunk_size, last - start), max_nodes)
+             for start in range(first, last, chunk_size))
+    for (start, _, _), groups in run_pool(classify_chunk, tasks, workers,
+                                          report if progress else None):
+        chunks[start] = groups
+
+    # Внутри группы записи идут по возрастанию seed
+    groups = [b''.join(chunks[start][group] for start in sorted(chunks))
+              for group in range(len(GROUPS))]
+    write_library(out, groups)
+    return [len(data) // RECORD.size for data in groups]
+
+
+class DealLibrary:
+    """Библиотека раскладов, отображенная в память."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as stream:
+            self.map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < FILE_HEADER.size:
+            self.close()
+            raise ValueError(f"{path}: не библиотека раскладов")
+        magic, _, *counts = FILE_HEADER.unpack_from(self.map)
+        if magic != FILE_MAGIC or len(self.map) < FILE_HEADER.size + sum(counts) * RECORD.size:
+            self.close()
+            raise ValueError(f"{path}: не библиотека раскладов или файл обрезан")
+        self.counts: List[int] = counts
+        # Номер первой записи каждой группы
+        self.starts = [sum(counts[:group]) for group in range(len(GROUPS))]
+
+    def __len__(self) -> int:
+        return sum(self.counts)
+
+    def deal(self, index: int) -> Deal:
+        """Запись с номером index (записи сгруппированы по GROUPS)."""
+        return Deal(*RECORD.unpack_from(self.map, FILE_HEADER.size + index * RECORD.size))
+
+    def sample(self, difficulty: Optional[str] = None,
+               rng: Optional[random.Random] = None) -> Optional[Deal]:
+        """Случайный решаемый расклад сложности difficulty (по умолчанию - любой).
+
+        Возвращает None, если таких раскладов в библиотеке нет.
+        """
+        groups = [DIFFICULTIES.index(difficulty)] if difficulty else range(len(DIFFICULTIES))
+        total = sum(self.counts[group] for group in groups)
+        if not total:
+            return None
+        k = (rng or random).randrange(total)
+        for group in groups:
+            if k < self.counts[group]:
+                break
+            k -= self.counts[group]
+        return self.deal(self.starts[group] + k)
+
+    def close(self) -> None:
+        self.map.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Библиотека раскладов 'Косынки'")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help="решить расклады и записать библиотеку")
+    build_parser.add_argument('--seeds', type=parse_range, default=(0, 1000),
+                              help="диапазон seed first:last")
+    build_parser.add_argument('--out', required=True, help="файл библиотеки")
+    build_parser.add_argument('--workers', type=int,
+                              help="число процессов (по умолчанию - все ядра)")
+    build_parser.add_argument('--chunk', type=int, default=100, help="раскладов в одном задании")
+    build_parser.add_argument('--max-nodes', type=int, default=20000,
+                              help="бюджет узлов решателя на расклад")
+    info_parser = commands.add_parser('info', help="вывести состав библиотеки")
+    info_parser.add_argument('path', help="файл библиотеки")
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        counts = build(*args.seeds, args.out, args.workers, args.chunk, args.max_nodes,
+                       progress=True)
+    else:
+        library = DealLibrary(args.path)
+        counts = library.counts
+        library.close()
+    print(', '.join(f"{name} {count}" for name, count in zip(GROUPS, counts)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,627 @@
+"""Правила игры 'Косынка' без зависимости от pygame.
+
+Модуль хранит состояние партии и применяет ходы. Его можно использовать в
+тестах, пакетных расчетах и из интерфейса (main.py), который только
+отображает состояние и переводит действия мыши в ходы.
+
+Карта кодируется числом 0..51: масть * 13 + ранг (туз - 0, король - 12).
+Ранг, масть и цвет карты берутся из заранее посчитанных таблиц, стопки
+хранятся в bytearray, а закрытые карты стопки tableau задаются их числом.
+"""
+import random
+import struct
+from array import array
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Типы карт
+SUITS = ['hearts', 'diamonds', 'clubs', 'spades']
+RANKS = ['A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K']
+
+# Карта - число 0..51
+Card = int
+
+KING = len(RANKS) - 1
+DECK_SIZE = len(SUITS) * len(RANKS)
+
+# Таблицы свойств карт
+CARD_SUIT = bytes(card // len(RANKS) for card in range(DECK_SIZE))
+CARD_RANK = bytes(card % len(RANKS) for card in range(DECK_SIZE))
+CARD_RED = bytes(SUITS[suit] in ['hearts', 'diamonds'] for suit in CARD_SUIT)
+
+# STACKS_ON[card * DECK_SIZE + top] == 1, если card можно положить на top в tableau
+STACKS_ON = bytes(CARD_RED[card] != CARD_RED[top] and CARD_RANK[card] + 1 == CARD_RANK[top]
+                  for card in range(DECK_SIZE) for top in range(DECK_SIZE))
+
+# FITS_ON[top] - карты, которые можно положить на top в tableau
+FITS_ON = [bytes(card for card in range(DECK_SIZE) if STACKS_ON[card * DECK_SIZE + top])
+           for top in range(DECK_SIZE)]
+KINGS = bytes(card for card in range(DECK_SIZE) if CARD_RANK[card] == KING)
+
+# ACCEPTS[card] - карты, на которые можно положить card в tableau
+ACCEPTS = [bytes(top for top in range(DECK_SIZE) if STACKS_ON[card * DECK_SIZE + top])
+           for card in range(DECK_SIZE)]
+
+# Ключ пустой стопки в индексе ходов (на нее кладется только король)
+EMPTY = DECK_SIZE
+
+# Номера стопок: 0..6 - tableau, далее отбой, фундаменты и сток
+WASTE = 7
+FOUNDATION = 8
+STOCK = 9
+
+# Стопки, из которых перекладываются карты
+SOURCES = range(WASTE + 1)
+ALL_SOURCES = (1 << len(SOURCES)) - 1
+
+# Компактная запись позиции (Game.pack): карт в фундаменте по мастям, закрытых
+# карт и длины стопок tableau, длины отбоя и стока, хеши tableau и талона;
+# затем карты стопок tableau снизу вверх, отбоя и стока по байту
+PACKED_HEADER = struct.Struct('<4s7s7sBBQQ')
+
+# Сколько позиций перебирать при поиске продвигающего хода через перекладывания
+PROGRESS_SEARCH_LIMIT = 200
+
+# Ключи Зобриста (64 бита). Позиция задается тем, какая карта на какой
+# лежит: стопка tableau - цепочка карт снизу вверх, сток и отбой - цепочка
+# в порядке сдачи (отбой снизу вверх, затем сток сверху вниз), которая не
+# меняется при сдаче и перевороте отбоя. Хеш - XOR ключей пар соседних
+# карт: ZOBRIST_CARD[((below * DECK_SIZE + card) * 2 + открыта)] для карты
+# card на карте below в tableau (CHAIN_END - низ стопки) и ZOBRIST_TALON
+# для пар цепочки талона (CHAIN_END - ее концы). Перенос серии карт меняет
+# одну пару, открытие карты - ключ одной пары, взятие карты из отбоя - три
+# пары, поэтому хеш обновляется за O(1) при ходе и отмене хода. Номер
+# стопки в ключи пар не входит; фундаменты тоже: в них лежат все остальные
+# карты.
+CHAIN_END = DECK_SIZE
+_zobrist_rng = random.Random(0x50117)
+ZOBRIST_CARD = [_zobrist_rng.getrandbits(64) for _ in range((DECK_SIZE + 1) * DECK_SIZE * 2)]
+ZOBRIST_TALON = [_zobrist_rng.getrandbits(64) for _ in range((DECK_SIZE + 1) ** 2)]
+# Те же ключи пар tableau по индексу below * DECK_SIZE + card: открытая
+# карта и XOR закрытой и открытой (открытие карты)
+ZOBRIST_OPEN = ZOBRIST_CARD[1::2]
+ZOBRIST_FLIP = [closed ^ opened for closed, opened in zip(ZOBRIST_CARD[::2], ZOBRIST_OPEN)]
+# Нижняя карта i-й стопки (ZOBRIST_BOTTOM[i * (DECK_SIZE + 1) + card]) и
+# положение указателя сдачи (длина отбоя) - для точного ключа позиции
+ZOBRIST_BOTTOM = [_zobrist_rng.getrandbits(64) for _ in range(7 * (DECK_SIZE + 1))]
+ZOBRIST_POINTER = [_zobrist_rng.getrandbits(64) for _ in range(DECK_SIZE)]
+
+
+class Move(NamedTuple):
+    """Ход: из стопки src переложить count верхних карт в стопку dst.
+
+    Взятие карты из стока (и переворот отбоя) - ход Move(STOCK, 1, WASTE).
+    """
+    src: int
+    count: int
+    dst: int
+
+
+DEAL = Move(STOCK, 1, WASTE)
+
+# Обратимая запись хода (delta) - 16 бит: код хода (move_code, 12 бит),
+# флаги "открылась карта" и "отбой перевернут в сток", масть карты,
+# ушедшей в фундамент
+MOVE_CODE_MASK = 0xFFF
+DELTA_FLIPPED = 1 << 12
+DELTA_RECYCLED = 1 << 13
+DELTA_SUIT_SHIFT = 14
+
+
+def move_code(move: Move) -> int:
+    """Код хода: src, dst и count по 4 бита."""
+    return move.src | move.dst << 4 | move.count << 8
+
+
+def delta_move(delta: int) -> Move:
+    """Ход, записанный в delta или в коде хода."""
+    return Move(delta & 15, delta >> 8 & 15, delta >> 4 & 15)
+
+
+def shuffled_deck(seed: Optional[int] = None) -> List[Card]:
+    """Перемешанная колода; при заданном seed порядок воспроизводим."""
+    deck = list(range(DECK_SIZE))
+    if seed is None:
+        random.shuffle(deck)
+    else:
+        random.Random(seed).shuffle(deck)
+    return deck
+
+
+def talon_link(prev: int, card: int, after: int) -> int:
+    """XOR, вставляющий card между соседями prev и after в цепочке талона (или убирающий)."""
+    end = CHAIN_END + 1
+    return (ZOBRIST_TALON[prev * end + card] ^ ZOBRIST_TALON[card * end + after] ^
+            ZOBRIST_TALON[prev * end + after])
+
+
+def card_name(card: Card) -> str:
+    """Название карты, например 'Q of spades'."""
+    return f"{RANKS[CARD_RANK[card]]} of {SUITS[CARD_SUIT[card]]}"
+
+
+class Pile:
+    """Стопка tableau: карты снизу вверх и число закрытых карт снизу."""
+
+    __slots__ = ('cards', 'hidden')
+
+    def __init__(self, cards: bytes = b'', hidden: int = 0):
+        self.cards = bytearray(cards)
+        self.hidden = hidden
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def open_cards(self) -> bytearray:
+        """Открытые карты стопки."""
+        return self.cards[self.hidden:]
+
+
+class Game:
+    """Состояние партии и применение ходов."""
+
+    __slots__ = ('stock', 'waste', 'foundations', 'tableau', 'offers', 'by_target', 'dirty',
+                 'tableau_hash', 'talon_hash')
+
+    def __init__(self, deck: Optional[List[Card]] = None):
+        # Создаем колоду карт
+        deck = shuffled_deck() if deck is None else list(deck)
+
+        # Раздача карт в tableau: последняя карта в каждой стопке открыта
+        self.tableau: List[Pile] = []
+        for i in range(7):
+            self.tableau.append(Pile([deck.pop() for _ in range(i + 1)], i))
+
+        # Оставшиеся карты идут в сток (закрытыми, верх - в конце)
+        self.stock = bytearray(deck)
+        self.waste = bytearray()
+
+        # Фундамент хранит число карт, уже собранных по каждой масти
+        self.foundations = bytearray(len(SUITS))
+
+        self.reset_index()
+        self.rehash()
+
+    def reset_index(self) -> None:
+        """Сбрасывает индекс ходов: он будет построен заново при запросе.
+
+        Для каждой стопки-источника хранятся предложения (карта, число карт):
+        взяв count верхних карт, можно положить их на указанную карту (или
+        на пустую стопку, ключ EMPTY). by_target - те же предложения,
+        сгруппированные по карте, на которую кладут. dirty - битовая маска
+        источников, изменившихся после последнего пересчета: ход меняет
+        только их.
+        """
+        self.offers: List[List[Tuple[int, int]]] = [[] for _ in SOURCES]
+        self.by_target: Dict[int, Dict[int, int]] = {}
+        self.dirty = ALL_SOURCES
+
+    def pack(self) -> bytes:
+        """Компактная запись позиции (до PACKED_HEADER.size + 52 байт).
+
+        Сама партия - объекты Python (около 1.2 КБ), в этом виде ее удобно
+        хранить и передавать; обратно - Game.unpack.
+        """
+        tableau = self.tableau
+        header = PACKED_HEADER.pack(bytes(self.foundations),
+                                    bytes(pile.hidden for pile in tableau),
+                                    bytes(len(pile.cards) for pile in tableau),
+                                    len(self.waste), len(self.stock),
+                                    self.tableau_hash, self.talon_hash)
+        return b''.join((header, *(pile.cards for pile in tableau), self.waste, self.stock))
+
+    @staticmethod
+    def unpack(data: bytes) -> 'Game':
+        """Партия из записи Game.pack; хеши не пересчитываются."""
+        (foundations, hidden, lengths, waste, stock,
+         tableau_hash, talon_hash) = PACKED_HEADER.unpack_from(data)
+        if len(data) != PACKED_HEADER.size + sum(lengths) + waste + stock:
+            raise ValueError("запись позиции повреждена")
+        game = Game.__new__(Game)
+        game.foundations = bytearray(foundations)
+        game.tableau = []
+        offset = PACKED_HEADER.size
+        for pile_hidden, length in zip(hidden, lengths):
+            game.tableau.append(Pile(data[offset:offset + length], pile_hidden))
+            offset += length
+        game.waste = bytearray(data[offset:offset + waste])
+        game.stock = bytearray(data[offset + waste:])
+        game.tableau_hash = tableau_hash
+        game.talon_hash = talon_hash
+        game.reset_index()
+        return game
+
+    def copy(self) -> 'Game':
+        """Независимая копия партии."""
+        game = Game.__new__(Game)
+        game.stock = self.stock[:]
+        game.waste = self.waste[:]
+        game.foundations = self.foundations[:]
+        game.tableau = [Pile(pile.cards, pile.hidden) for pile in self.tableau]
+        game.reset_index()
+        game.tableau_hash = self.tableau_hash
+        game.talon_hash = self.talon_hash
+        return game
+
+    def rehash(self) -> None:
+        """Пересчитывает хеши tableau и талона с нуля.
+
+        Ходы и отмена ходов обновляют их сами; пересчет нужен только при
+        создании партии.
+        """
+        h = 0
+        for pile in self.tableau:
+            below = CHAIN_END
+            for depth, card in enumerate(pile.cards):
+                h ^= ZOBRIST_CARD[(below * DECK_SIZE + card) * 2 + (depth >= pile.hidden)]
+                below = card
+        self.tableau_hash = h
+
+        h = 0
+        prev = CHAIN_END
+        for card in self.waste + self.stock[::-1]:
+            h ^= ZOBRIST_TALON[prev * (CHAIN_END + 1) + card]
+            prev = card
+        self.talon_hash = h ^ ZOBRIST_TALON[prev * (CHAIN_END + 1) + CHAIN_END]
+
+    def canonical_key(self) -> int:
+        """64-битный ключ позиции без учета порядка стопок tableau и указателя сдачи.
+
+        Позиции, отличающиеся только перестановкой стопок (в том числе
+        пустых) или числом сданных карт, получают один ключ.
+        """
+        return self.tableau_hash ^ self.talon_hash
+
+    def key(self) -> int:
+        """64-битный ключ позиции с учетом номеров стопок и указателя сдачи."""
+        h = self.tableau_hash ^ self.talon_hash ^ ZOBRIST_POINTER[len(self.waste)]
+        for i, pile in enumerate(self.tableau):
+            h ^= ZOBRIST_BOTTOM[i * (CHAIN_END + 1) + (pile.cards[0] if pile.cards else CHAIN_END)]
+        return h
+
+    def unlink_waste_top(self) -> None:
+        """Убирает верхнюю карту отбоя из хеша талона (перед тем как ее взять)."""
+        waste = self.waste
+        self.talon_hash ^= talon_link(waste[-2] if len(waste) > 1 else CHAIN_END, waste[-1],
+                                      self.stock[-1] if self.stock else CHAIN_END)
+
+    def foundation_top(self, suit: int) -> Optional[Card]:
+        """Верхняя карта фундамента масти suit."""
+        count = self.foundations[suit]
+        return suit * len(RANKS) + count - 1 if count else None
+
+    def can_move_to_foundation(self, card: Card) -> bool:
+        """Можно ли переместить карту в фундамент."""
+        return self.foundations[CARD_SUIT[card]] == CARD_RANK[card]
+
+    def can_move_to_tableau(self, card: Card, pile_idx: int) -> bool:
+        """Можно ли переместить карту в указанную стопку tableau."""
+        cards = self.tableau[pile_idx].cards
+        if not cards:
+            return CARD_RANK[card] == KING
+        return STACKS_ON[card * DECK_SIZE + cards[-1]] == 1
+
+    def top_cards(self, src: int) -> bytearray:
+        """Карты стопки-источника: отбой или стопка tableau."""
+        return self.waste if src == WASTE else self.tableau[src].cards
+
+    def movable_count(self, src: int) -> int:
+        """Сколько верхних карт можно взять из стопки."""
+        if src == WASTE:
+            return 1 if self.waste else 0
+        pile = self.tableau[src]
+        return len(pile.cards) - pile.hidden
+
+    def move_to_foundation(self, src: int) -> bool:
+        """Переместить верхнюю карту отбоя или стопки tableau src в фундамент."""
+        if not self.movable_count(src):
+            return False
+        cards = self.top_cards(src)
+        if not self.can_move_to_foundation(cards[-1]):
+            return False
+
+        if src == WASTE:
+            self.unlink_waste_top()
+        else:
+            below = cards[-2] if len(cards) > 1 else CHAIN_END
+            self.tableau_hash ^= ZOBRIST_OPEN[below * DECK_SIZE + cards[-1]]
+        self.foundations[CARD_SUIT[cards.pop()]] += 1
+        if src != WASTE:
+            self.reveal(src)
+        self.dirty |= 1 << src
+        return True
+
+    def move_to_tableau(self, src: int, count: int, dst: int) -> bool:
+        """Переместить count верхних карт отбоя или стопки tableau src в стопку dst.
+
+        Из отбоя можно взять только одну карту, из tableau - только открытые.
+        """
+        if count < 1 or count > self.movable_count(src) or src == dst:
+            return False
+        cards = self.top_cards(src)
+        if not self.can_move_to_tableau(cards[-count], dst):
+            return False
+
+        # Серия меняет только пару с картой, на которой лежит ее нижняя карта
+        card = cards[-count]
+        dst_cards = self.tableau[dst].cards
+        if src == WASTE:
+            self.unlink_waste_top()
+        else:
+            below = cards[-count - 1] if len(cards) > count else CHAIN_END
+            self.tableau_hash ^= ZOBRIST_OPEN[below * DECK_SIZE + card]
+        top = dst_cards[-1] if dst_cards else CHAIN_END
+        self.tableau_hash ^= ZOBRIST_OPEN[top * DECK_SIZE + card]
+        dst_cards += cards[-count:]
+        del cards[-count:]
+        if src != WASTE:
+            self.reveal(src)
+        self.dirty |= (1 << src) | (1 << dst)
+        return True
+
+    def apply(self, move: Move) -> bool:
+        """Применить ход; возвращает False, если ход недопустим.
+
+        Из стока допустим только DEAL, источник - отбой или стопка tableau,
+        цель - стопка tableau или фундамент.
+        """
+        src, count, dst = move
+        if src == STOCK:
+            if count != 1 or dst != WASTE or not (self.stock or self.waste):
+                return False
+            self.deal_from_stock()
+            return True
+        if not 0 <= src <= WASTE:
+            return False
+        if dst == FOUNDATION:
+            return count == 1 and self.move_to_foundation(src)
+        if not 0 <= dst < WASTE:
+            return False
+        return self.move_to_tableau(src, count, dst)
+
+    def play(self, move: Move) -> Optional[int]:
+        """Применить ход и вернуть его обратимую запись (delta).
+
+        Возвращает None, если ход недопустим.
+        """
+        src, count, dst = move
+        if not (0 <= src <= WASTE or src == STOCK):
+            return None
+        delta = move_code(move)
+        if src == STOCK:
+            if not self.stock:
+                delta |= DELTA_RECYCLED
+        elif dst == FOUNDATION and self.movable_count(src):
+            delta |= CARD_SUIT[self.top_cards(src)[-1]] << DELTA_SUIT_SHIFT
+        hidden = self.tableau[src].hidden if src < WASTE else 0
+        if not self.apply(move):
+            return None
+        if hidden and self.tableau[src].hidden != hidden:
+            delta |= DELTA_FLIPPED
+        return delta
+
+    def undo(self, delta: int) -> None:
+        """Отменить ход по его записи из play; ход должен быть последним."""
+        src, count, dst = delta_move(delta)
+        if src == STOCK:
+            if delta & DELTA_RECYCLED:
+                self.stock, self.waste = self.waste, self.stock
+                self.waste.reverse()
+            else:
+                self.stock.append(self.waste.pop())
+            self.dirty |= 1 << WASTE
+            return
+
+        if delta & DELTA_FLIPPED:
+            pile = self.tableau[src]
+            pile.hidden += 1
+            cards = pile.cards
+            below = cards[-2] if len(cards) > 1 else CHAIN_END
+            self.tableau_hash ^= ZOBRIST_FLIP[below * DECK_SIZE + cards[-1]]
+        if dst == FOUNDATION:
+            suit = delta >> DELTA_SUIT_SHIFT
+            self.foundations[suit] -= 1
+            run = bytes((suit * len(RANKS) + self.foundations[suit],))
+        else:
+            cards = self.tableau[dst].cards
+            run = cards[-count:]
+            below = cards[-count - 1] if len(cards) > count else CHAIN_END
+            self.tableau_hash ^= ZOBRIST_OPEN[below * DECK_SIZE + run[0]]
+            del cards[-count:]
+            self.dirty |= 1 << dst
+
+        if src == WASTE:
+            waste = self.waste
+            self.talon_hash ^= talon_link(waste[-1] if waste else CHAIN_END, run[0],
+                                          self.stock[-1] if self.stock else CHAIN_END)
+        else:
+            cards = self.tableau[src].cards
+            below = cards[-1] if cards else CHAIN_END
+            self.tableau_hash ^= ZOBRIST_OPEN[below * DECK_SIZE + run[0]]
+        self.top_cards(src).extend(run)
+        self.dirty |= 1 << src
+
+    def reveal(self, pile_idx: int) -> None:
+        """Открывает верхнюю карту стопки tableau после хода из нее."""
+        pile = self.tableau[pile_idx]
+        if pile.hidden and pile.hidden == len(pile.cards):
+            pile.hidden -= 1
+            cards = pile.cards
+            below = cards[-2] if len(cards) > 1 else CHAIN_END
+            self.tableau_hash ^= ZOBRIST_FLIP[below * DECK_SIZE + cards[-1]]
+
+    def deal_from_stock(self) -> None:
+        """Взять карты из стока в отбой."""
+        if self.stock:
+            self.waste.append(self.stock.pop())
+        else:
+            # Если сток пуст, переворачиваем отбой обратно в сток
+            self.waste.reverse()
+            self.stock, self.waste = self.waste, self.stock
+        self.dirty |= 1 << WASTE
+
+    def check_win(self) -> bool:
+        """Проверка, выиграна ли игра."""
+        return all(count == len(RANKS) for count in self.foundations)
+
+    def update_index(self) -> None:
+        """Пересчитывает предложения стопок, изменившихся после прошлого вызова."""
+        dirty = self.dirty
+        if not dirty:
+            return
+        self.dirty = 0
+        by_target = self.by_target
+        for src in SOURCES:
+            if not dirty >> src & 1:
+                continue
+            for target, _ in self.offers[src]:
+                del by_target[target][src]
+
+            offers = []
+            if src == WASTE:
+                run = self.waste[-1:]
+            else:
+                pile = self.tableau[src]
+                run = pile.cards[pile.hidden:]
+            # count - число карт, которые берутся вместе с картой run[-count]
+            for count in range(1, len(run) + 1):
+                card = run[-count]
+                for target in ACCEPTS[card]:
+                    offers.append((target, count))
+                if CARD_RANK[card] == KING:
+                    offers.append((EMPTY, count))
+            for target, count in offers:
+                by_target.setdefault(target, {})[src] = count
+            self.offers[src] = offers
+
+    def legal_moves(self) -> List[Move]:
+        """Все допустимые ходы, включая взятие карты из стока.
+
+        Ходы в tableau берутся из индекса по верхней карте каждой стопки,
+        ходы в фундамент проверяются по верхним картам источников.
+        """
+        self.update_index()
+        moves = []
+        by_target = self.by_target
+        for dst, pile in enumerate(self.tableau):
+            offers = by_target.get(pile.cards[-1] if pile.cards else EMPTY)
+            if offers:
+                for src, count in offers.items():
+                    if src != dst:
+                        moves.append(Move(src, count, dst))
+
+        foundations = self.foundations
+        for src in SOURCES:
+            if self.movable_count(src):
+                card = self.top_cards(src)[-1]
+                if foundations[CARD_SUIT[card]] == CARD_RANK[card]:
+                    moves.append(Move(src, 1, FOUNDATION))
+
+        if self.stock or self.waste:
+            moves.append(DEAL)
+        return moves
+
+    def is_progress(self, move: Move) -> bool:
+        """Продвигает ли ход партию.
+
+        Продвигающие ходы: в фундамент, из отбоя и перекладывания всех
+        открытых карт стопки, если под ними есть закрытая карта или стопка
+        освобождается (кроме переноса короля на пустое место).
+        """
+        if move.dst == FOUNDATION or move.src == WASTE:
+            return True
+        if move.src == STOCK:
+            return False
+        pile = self.tableau[move.src]
+        if move.count != len(pile.cards) - pile.hidden:
+            return False
+        return pile.hidden > 0 or bool(self.tableau[move.dst].cards)
+
+    def talon_playable(self) -> bool:
+        """Можно ли сыграть хоть одну карту стока или отбоя.
+
+        При сдаче по одной карте с неограниченным числом переворотов каждая
+        карта стока и отбоя рано или поздно оказывается наверху отбоя,
+        поэтому полный цикл стока проверяется сразу по всем картам.
+        """
+        wanted = bytearray(DECK_SIZE)
+        for suit, count in enumerate(self.foundations):
+            if count < len(RANKS):
+                wanted[suit * len(RANKS) + count] = 1
+        for pile in self.tableau:
+            for card in FITS_ON[pile.cards[-1]] if pile.cards else KINGS:
+                wanted[card] = 1
+        return any(wanted[card] for card in self.stock) or any(wanted[card] for card in self.waste)
+
+    def has_progress_move(self) -> bool:
+        """Есть ли ход, продвигающий партию (см. is_progress).
+
+        Учитываются все карты стока и отбоя, а также перекладывания внутри
+        tableau, которые сами ничего не открывают, но ведут к продвигающему
+        ходу. Если таких позиций слишком много, ход считается найденным.
+        """
+        frontier = [self]
+        seen = {self.tableau_key()}
+        while frontier:
+            game = frontier.pop()
+            if game.talon_playable():
+                return True
+            for move in game.legal_moves():
+                if move.src == STOCK:
+                    continue
+                if game.is_progress(move):
+                    return True
+                child = game.copy()
+                child.apply(move)
+                key = child.tableau_key()
+                if key not in seen:
+                    if len(seen) >= PROGRESS_SEARCH_LIMIT:
+                        return True
+                    seen.add(key)
+                    frontier.append(child)
+        return False
+
+    def tableau_key(self) -> Tuple[bytes, ...]:
+        """Ключ раскладки tableau для поиска повторяющихся позиций."""
+        return tuple(bytes(pile.cards) for pile in self.tableau)
+
+
+class History:
+    """Журнал ходов партии для отмены и повтора.
+
+    Ход хранится записью delta из Game.play (2 байта), поэтому отмена и
+    повтор не копируют стопки и не зависят от длины партии.
+    """
+
+    __slots__ = ('done', 'undone')
+
+    def __init__(self):
+        self.done = array('H')
+        self.undone = array('H')
+
+    def play(self, game: Game, move: Move) -> bool:
+        """Сделать ход и записать его; отмененные ходы забываются."""
+        delta = game.play(move)
+        if delta is None:
+            return False
+        self.done.append(delta)
+        if self.undone:
+            self.undone = array('H')
+        return True
+
+    def undo(self, game: Game) -> bool:
+        """Отменить последний ход; False, если отменять нечего."""
+        if not self.done:
+            return False
+        delta = self.done.pop()
+        game.undo(delta)
+        self.undone.append(delta)
+        return True
+
+    def redo(self, game: Game) -> bool:
+        """Повторить последний отмененный ход; False, если повторять нечего."""
+        if not self.undone:
+            return False
+        delta = self.undone.pop()
+        game.apply(delta_move(delta))
+        self.done.append(delta)
+        return True
@@ -0,0 +1,155 @@
+"""Подсказка хода в фоновом процессе.
+
+HintService ищет лучший ход решателем (solver.Solver) в отдельном
+процессе с пониженным приоритетом, поэтому поиск не занимает главный
+цикл интерфейса. Позиция передается копией; при смене позиции текущий
+поиск отменяется через общий счетчик запросов, который решатель
+проверяет во время перебора. Найденные подсказки хранятся в LRU-кэше по
+ключу позиции (Game.key) и передаются через функцию notify, которая
+вызывается из служебного потока.
+
+Модуль не зависит от pygame: интерфейс передает в notify функцию,
+отправляющую pygame-событие.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, Future
+from typing import Callable, NamedTuple, Optional
+
+from engine import Game, Move, DEAL
+from solver import Solver, SOLVED, UNKNOWN
+
+# Номер текущего запроса в процессе поиска (общий с процессом интерфейса)
+_generation = None
+
+
+class Hint(NamedTuple):
+    """Подсказка для позиции."""
+    key: int               # ключ позиции (Game.key)
+    move: Optional[Move]   # лучший ход или None, если ходов нет
+    status: str            # итог решателя: SOLVED, UNWINNABLE или UNKNOWN
+    nodes: int             # число рассмотренных позиций
+    elapsed: float         # время поиска, с
+
+
+def _init_worker(generation) -> None:
+    """Настройка процесса поиска: общий счетчик запросов и низкий приоритет."""
+    global _generation
+    _generation = generation
+    if hasattr(os, 'nice'):
+        os.nice(10)
+
+
+def best_move(game: Game) -> Optional[Move]:
+    """Ход по приоритетам решателя без перебора (если решение не найдено)."""
+    lines = Solver().expand(game)
+    if lines:
+        return lines[0][0]
+    if game.stock or game.waste:
+        return DEAL
+    return None
+
+
+def search(game: Game, key: int, generation: int, max_nodes: int, time_limit: float) -> Hint:
+    """Ищет подсказку (выполняется в процессе поиска)."""
+    start = time.perf_counter()
+
+    def cancelled() -> bool:
+        return _generation is not None and _generation.value != generation
+
+    result = Solver(max_nodes, time_limit).solve(game, cancelled)
+    move = result.moves[0] if result.status == SOLVED and result.moves else best_move(game)
+    return Hint(key, move, result.status, result.nodes, time.perf_counter() - start)
+
+
+class HintService:
+    """Поиск подсказок в фоне с отменой устаревших запросов и LRU-кэшем."""
+
+    def __init__(self, notify: Callable[[Hint], None], time_limit: float = 1.0,
+                 max_nodes: int = 200_000, cache_size: int = 256):
+        self.notify = notify
+        self.time_limit = time_limit
+        self.max_nodes = max_nodes
+        self.cache_size = cache_size
+        self.cache: 'OrderedDict[int, Hint]' = OrderedDict()
+        self.lock = threading.Lock()
+        # Номер последнего запроса; процесс поиска видит его через общий
+        # счетчик generation
+        self.requests = 0
+        # Процесс поиска и общий счетчик создаются при первом поиске:
+        # multiprocessing не загружается, пока подсказка не нужна
+        self.generation = None
+        self.pool = None
+
+    def request(self, game: Game) -> Optional[Hint]:
+        """Запрашивает подсказку для позиции.
+
+        Подсказка из кэша возвращается сразу, иначе запускается поиск, а
+        результат придет через notify. Предыдущий поиск отменяется. Если
+        процесс поиска погиб (например, убит при нехватке памяти), запускается
+        новый; не удалось и это - подсказки нет, но игра продолжается.
+        """
+        key = game.key()
+        with self.lock:
+            hint = self.cache.get(key)
+            if hint is not None:
+                self.cache.move_to_end(key)
+                return hint
+        generation = self.cancel()
+        for _ in range(2):
+            if self.pool is None:
+                self._start()
+            try:
+                future = self.pool.submit(search, game.copy(), key, generation,
+                                          self.max_nodes, self.time_limit)
+                break
+            except BrokenExecutor:
+                self.pool.shutdown(wait=False)
+                self.pool = None
+        else:
+            return None
+        future.add_done_callback(lambda done: self._finished(done, generation))
+        return None
+
+    def _start(self) -> None:
+        """Запускает процесс поиска."""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        context = multiprocessing.get_context('spawn')
+        self.generation = context.Value('i', self.requests, lock=False)
+        self.pool = ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                        initializer=_init_worker,
+                                        initargs=(self.generation,))
+
+    def cancel(self) -> int:
+        """Отменяет текущий поиск (позиция изменилась); возвращает номер нового запроса."""
+        self.requests += 1
+        if self.generation is not None:
+            self.generation.value = self.requests
+        return self.requests
+
+    def _finished(self, future: Future, generation: int) -> None:
+        """Обработка результата поиска (вызывается из служебного потока)."""
+        if future.cancelled() or future.exception() is not None:
+            return
+        hint = future.result()
+        # Поиск, прерванный сменой позиции, ничего не доказал: в кэш не попадает
+        if hint.status != UNKNOWN or generation == self.requests:
+            with self.lock:
+                self.cache[hint.key] = hint
+                self.cache.move_to_end(hint.key)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        if generation == self.requests:
+            self.notify(hint)
+
+    def close(self) -> None:
+        """Останавливает процесс поиска."""
+        self.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
@@ -1,11 +1,46 @@
-import pygame
+import argparse
+import json
+import os
 import random
-from typing import List, Tuple, Dict, Optional
-
-# Инициализация pygame
-pygame.init()
-
-# Константы
+import sys
+import time
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Tuple, Dict, Optional, Union
+
+
+def import_pygame():
+    """Импортирует pygame без необязательных модулей.
+
+    При импорте pygame подключает numpy (для pygame.surfarray) и
+    pkg_resources (для поиска встроенного шрифта), что занимает большую часть
+    времени запуска. Игре они не нужны: на время импорта они помечаются
+    отсутствующими. Другие модули могут затем импортировать их сами, но
+    pygame.surfarray и pygame.sndarray в этом процессе остаются недоступны
+    (MissingModule).
+    """
+    blocked = [name for name in ('numpy', 'pkg_resources') if name not in sys.modules]
+    for name in blocked:
+        sys.modules[name] = None
+    try:
+        import pygame
+    finally:
+        for name in blocked:
+            del sys.modules[name]
+    return pygame
+
+
+pygame = import_pygame()
+
+from animation import Animator, Point, linear
+from engine import (Card, Game, History, Move, DEAL, SUITS, RANKS, CARD_RANK, CARD_SUIT,
+                    CARD_RED, DECK_SIZE, KING, SOURCES, WASTE, FOUNDATION, STOCK, shuffled_deck)
+from deals import DIFFICULTIES, DealLibrary
+from hint import Hint, HintService
+from pool import SEED_LIMIT, parse_seed
+from profiler import FrameProfiler
+from replay import append_replay, replay_of
+
+# Константы: размеры окна по умолчанию и стола в масштабе 1
 SCREEN_WIDTH = 1000
 SCREEN_HEIGHT = 700
 CARD_WIDTH = 71
@@ -13,6 +48,25 @@ CARD_HEIGHT = 96
 CARD_GAP = 20
 CARD_GAP_STACK = 30
 MARGIN = 20
+FPS = 60
+
+# Масштаб стола округляется до шага, чтобы при плавном изменении размера
+# окна изображения карт не перерисовывались на каждом шаге
+SCALE_STEP = 0.05
+MIN_SCALE = 0.5
+
+# Память под изображения карт всех масштабов (LRU-кэш), байт
+ART_CACHE_BYTES = 64 * 1024 * 1024
+
+# Анимация: задержка между картами при раздаче и при переносе в фундамент,
+# перелет карт при выигрыше, с
+DEAL_STAGGER = 0.03
+AUTO_MOVE_STAGGER = 0.08
+CASCADE_STAGGER = 0.06
+CASCADE_DURATION = 1.4
+
+# Если областей перерисовки больше, дешевле перерисовать их объединение
+MAX_DIRTY_RECTS = 16
 
 # Цвета
 GREEN = (0, 100, 0)
@@ -20,446 +74,942 @@ WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 BLUE = (0, 0, 255)
+YELLOW = (255, 215, 0)
+
+# Событие с найденной подсказкой (атрибут hint)
+HINT_EVENT = pygame.event.custom_type()
+
+# Размер оверлея с временами фаз главного цикла (F3)
+PROFILE_SIZE = (260, 160)
+
+# Файл, в котором между запусками хранятся найденные пути шрифтов
+FONT_CACHE_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                               os.path.expanduser(os.path.join('~', '.cache')),
+                               'soliter', 'fonts.json')
+
+# Через сколько секунд снова искать шрифт, не найденный в системе
+FONT_RETRY_SECONDS = 24 * 60 * 60
+
+
+def init_display(fullscreen: bool = False) -> pygame.Surface:
+    """Открывает окно игры (изменяемого размера) или полноэкранный режим.
+
+    Инициализируются только дисплей и шрифты: звук, джойстики и остальные
+    подсистемы pygame игре не нужны, а их запуск задерживает первый кадр.
+    """
+    pygame.display.init()
+    pygame.font.init()
+    if fullscreen:
+        return pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+    return pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.RESIZABLE)
+
+
+def table_scale(size: Tuple[int, int]) -> float:
+    """Масштаб стола, при котором стол по умолчанию вписывается в окно size."""
+    scale = min(size[0] / SCREEN_WIDTH, size[1] / SCREEN_HEIGHT)
+    return max(MIN_SCALE, round(round(scale / SCALE_STEP) * SCALE_STEP, 2))
+
+
+def scaled(value: int, scale: float) -> int:
+    """Размер value (в масштабе 1) в пикселях при масштабе scale."""
+    return max(1, round(value * scale))
+
+
+class FontCache:
+    """Шрифты интерфейса.
+
+    pygame.font.SysFont при первом вызове перебирает все шрифты системы
+    (fc-list), поэтому путь к файлу шрифта ищется один раз и сохраняется в
+    FONT_CACHE_PATH для следующих запусков. Если шрифт не найден, используется
+    встроенный шрифт pygame; вместо пути запоминается время поиска, и через
+    FONT_RETRY_SECONDS шрифт ищется снова (его могли установить). Шрифт
+    каждого размера создается один раз.
+    """
+
+    def __init__(self, cache_path: str = FONT_CACHE_PATH):
+        self.cache_path = cache_path
+        # Имя -> путь к файлу или время неудачного поиска
+        self.paths: Optional[Dict[str, Union[str, float]]] = None
+        self.fonts: Dict[Tuple[str, int], pygame.font.Font] = {}
+
+    def get(self, name: str, size: int) -> pygame.font.Font:
+        """Шрифт name размера size."""
+        font = self.fonts.get((name, size))
+        if font is None:
+            font = self.fonts[name, size] = pygame.font.Font(self.path(name), size)
+        return font
+
+    def path(self, name: str) -> Optional[str]:
+        """Путь к файлу шрифта name (None - встроенный шрифт pygame)."""
+        if self.paths is None:
+            self.paths = self._load()
+        path = self.paths.get(name)
+        if path is None:
+            path = self.paths[name] = pygame.font.match_font(name) or time.time()
+            self._save()
+        return path if isinstance(path, str) else None
+
+    def _load(self) -> Dict[str, Union[str, float]]:
+        """Пути из файла кэша.
+
+        Пути к удаленным файлам и устаревшие неудачные поиски отбрасываются.
+        """
+        now = time.time()
+        try:
+            with open(self.cache_path) as stream:
+                paths = json.load(stream)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(paths, dict):
+            return {}
+        return {name: path for name, path in paths.items()
+                if isinstance(path, str) and os.path.isfile(path) or
+                isinstance(path, (int, float)) and 0 <= now - path < FONT_RETRY_SECONDS}
+
+    def _save(self) -> None:
+        """Сохраняет пути в файл кэша; ошибки записи не мешают игре."""
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, 'w') as stream:
+                json.dump(self.paths, stream)
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        """Забывает созданные шрифты (после pygame.font.quit)."""
+        self.fonts = {}
+
+
+fonts = FontCache()
+
+
+class CardSet(NamedTuple):
+    """Поверхности карт одного масштаба."""
+    faces: List[pygame.Surface]
+    back: pygame.Surface
+    stock_slot: pygame.Surface
+    empty_slot: pygame.Surface
+    size: int  # занимаемая память, байт
+
+
+class CardArt:
+    """Кэш заранее отрисованных поверхностей карт.
+
+    Все 52 лицевые стороны, рубашка и контуры пустых мест рисуются один раз
+    для каждого масштаба стола (вместе с тенью), после чего карта выводится
+    одним blit'ом. Наборы разных масштабов хранятся в LRU-кэше с
+    ограничением по памяти, поэтому возврат к прежнему размеру окна не
+    требует перерисовки. Кэш сбрасывается при смене формата пикселей
+    дисплея, а сукно перерисовывается при смене размера окна.
+    """
+
+    COLORKEY = (255, 0, 255)
+
+    def __init__(self, max_bytes: int = ART_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.sets: 'OrderedDict[float, CardSet]' = OrderedDict()
+        self.faces: List[pygame.Surface] = []
+        self.back: Optional[pygame.Surface] = None
+        self.stock_slot: Optional[pygame.Surface] = None
+        self.empty_slot: Optional[pygame.Surface] = None
+        self.felt: Optional[pygame.Surface] = None
+        self.scale: Optional[float] = None
+        self._format: Optional[tuple] = None
+
+    def invalidate(self) -> None:
+        """Сбрасывает кэш (например, после pygame.display.set_mode)."""
+        self.sets.clear()
+        self.faces = []
+        self.back = None
+        self.stock_slot = None
+        self.empty_slot = None
+        self.felt = None
+        self.scale = None
+        self._format = None
+
+    def validate(self, scale: float) -> bool:
+        """Готовит поверхности масштаба scale и сукно под размер дисплея.
+
+        Возвращает True, если текущие поверхности сменились.
+        """
+        display = pygame.display.get_surface()
+        pixel_format = (display.get_bitsize(), display.get_masks())
+        if pixel_format != self._format:
+            self.invalidate()
+            self._format = pixel_format
+        changed = False
+        if self.felt is None or self.felt.get_size() != display.get_size():
+            # Сукно стола во весь экран
+            felt = pygame.Surface(display.get_size())
+            felt.fill(GREEN)
+            self.felt = felt.convert()
+            changed = True
+        if scale != self.scale:
+            self._select(scale)
+            changed = True
+        return changed
+
+    def surface(self, card: Card, face_up: bool = True) -> pygame.Surface:
+        """Поверхность карты: лицевая сторона или рубашка."""
+        return self.faces[card] if face_up else self.back
+
+    def _select(self, scale: float) -> None:
+        """Делает текущим набор масштаба scale, вытесняя давно не нужные."""
+        card_set = self.sets.pop(scale, None) or self._build(scale)
+        self.sets[scale] = card_set
+        used = sum(cached.size for cached in self.sets.values())
+        while used > self.max_bytes and len(self.sets) > 1:
+            _, evicted = self.sets.popitem(last=False)
+            used -= evicted.size
+        self.faces, self.back, self.stock_slot, self.empty_slot, _ = card_set
+        self.scale = scale
+
+    def _blank(self, size: Tuple[int, int]) -> pygame.Surface:
+        """Пустая поверхность карты с местом под тень."""
+        surface = pygame.Surface(size)
+        surface.fill(self.COLORKEY)
+        return surface
+
+    def _finish(self, surface: pygame.Surface) -> pygame.Surface:
+        """Переводит поверхность в формат дисплея с прозрачным фоном."""
+        surface.set_colorkey(self.COLORKEY, pygame.RLEACCEL)
+        return surface.convert()
+
+    def _build(self, scale: float) -> CardSet:
+        """Отрисовывает все поверхности карт в масштабе scale."""
+        def px(value: int) -> int:
+            return scaled(value, scale)
+
+        width, height = px(CARD_WIDTH), px(CARD_HEIGHT)
+        size = (width + px(2), height + px(2))  # вместе с тенью
+        border, radius = px(2), px(5)
+        font = fonts.get('arial', px(20))
+        small_font = fonts.get('arial', px(14))
+
+        def card_base(fill: Tuple[int, int, int]) -> pygame.Surface:
+            """Карта с тенью и двойной оконтовкой."""
+            surface = self._blank(size)
+            pygame.draw.rect(surface, (50, 50, 50), (border, border, width, height), 0, radius)
+            pygame.draw.rect(surface, BLACK, (0, 0, width, height), 0, radius)
+            pygame.draw.rect(surface, fill, (border, border, width - 2 * border,
+                                             height - 2 * border), 0, radius)
+            return surface
+
+        faces = []
+        for card in range(DECK_SIZE):
+            color = RED if CARD_RED[card] else BLACK
+            surface = card_base(WHITE)
+            surface.blit(font.render(RANKS[CARD_RANK[card]], True, color), (px(5), px(5)))
+            # Масть в углу: первая буква масти
+            suit_text = small_font.render(SUITS[CARD_SUIT[card]][0].upper(), True, color)
+            surface.blit(suit_text, (width - px(15), height - px(20)))
+            faces.append(self._finish(surface))
+
+        # Рубашка с узором
+        back = card_base(BLUE)
+        pygame.draw.rect(back, WHITE, (px(5), px(5), width - px(10), height - px(10)),
+                         border, radius)
+        pygame.draw.line(back, WHITE, (px(10), px(10)), (width - px(10), height - px(10)), border)
+        pygame.draw.line(back, WHITE, (width - px(10), px(10)), (px(10), height - px(10)), border)
+
+        # Непустой сток
+        stock_slot = self._blank(size)
+        pygame.draw.rect(stock_slot, WHITE, (0, 0, width, height), 0, radius)
+        pygame.draw.rect(stock_slot, BLACK, (0, 0, width, height), border, radius)
+
+        # Контур пустого места
+        empty_slot = self._blank(size)
+        pygame.draw.rect(empty_slot, GREEN, (0, 0, width, height), border, radius)
+
+        surfaces = (back, stock_slot, empty_slot)
+        back, stock_slot, empty_slot = (self._finish(surface) for surface in surfaces)
+        memory = sum(surface.get_pitch() * surface.get_height()
+                     for surface in (*faces, back, stock_slot, empty_slot))
+        return CardSet(faces, back, stock_slot, empty_slot, memory)
+
+
+card_art = CardArt()
+
+
+class Layout:
+    """Геометрия стола и поиск объекта под курсором.
+
+    Размеры карт и отступов пересчитываются один раз при изменении размера
+    окна (resize), отрисовка и поиск под курсором берут готовые значения.
+    Места верхнего ряда и стопки tableau стоят с постоянным шагом, поэтому
+    столбец под курсором находится делением координаты x на шаг, а карта
+    в стопке - делением y на смещение карт. Поиск не зависит от числа карт
+    на столе. Границы карт включаются, как и при проверке прямоугольников.
+    """
+
+    def __init__(self, size: Tuple[int, int] = (SCREEN_WIDTH, SCREEN_HEIGHT)):
+        self.resize(size)
+
+    def resize(self, size: Tuple[int, int]) -> None:
+        """Пересчитывает геометрию стола для окна размера size."""
+        self.size = size
+        self.scale = scale = table_scale(size)
+        self.card_width = scaled(CARD_WIDTH, scale)
+        self.card_height = scaled(CARD_HEIGHT, scale)
+        self.card_size = (self.card_width, self.card_height)
+        # Поверхность карты вместе с тенью (CardArt)
+        self.art_size = (self.card_width + scaled(2, scale), self.card_height + scaled(2, scale))
+        self.margin = margin = scaled(MARGIN, scale)
+        self.gap_stack = scaled(CARD_GAP_STACK, scale)
+        self.drag_gap = scaled(CARD_GAP // 2, scale)  # смещение перетаскиваемых карт
+        self.step = self.card_width + margin
+        self.stock_pos = (margin, margin)
+        self.waste_pos = (margin + self.step, margin)
+        self.foundation_x = margin * 3 + self.card_width * 3
+        self.tableau_y = margin * 2 + self.card_height
+        # Оверлей замеров не масштабируется и стоит в правом нижнем углу
+        self.profile_rect = pygame.Rect((size[0] - PROFILE_SIZE[0] - 10,
+                                         size[1] - PROFILE_SIZE[1] - 10), PROFILE_SIZE)
+
+    def foundation_pos(self, i: int) -> Tuple[int, int]:
+        """Позиция i-го фундамента."""
+        return (self.foundation_x + i * self.step, self.margin)
+
+    def tableau_pos(self, i: int, j: int = 0) -> Tuple[int, int]:
+        """Позиция j-й карты i-й стопки tableau."""
+        return (self.margin + i * self.step, self.tableau_y + j * self.gap_stack)
+
+    def column(self, x: int, x0: int, count: int) -> Optional[int]:
+        """Номер места ряда, начинающегося с x0, под координатой x."""
+        if x < x0:
+            return None
+        i, offset = divmod(x - x0, self.step)
+        if i >= count or offset > self.card_width:
+            return None
+        return i
+
+    def top_slot(self, pos: Tuple[int, int]) -> Optional[int]:
+        """Место верхнего ряда под курсором: STOCK, WASTE или FOUNDATION."""
+        x, y = pos
+        if not self.margin <= y <= self.margin + self.card_height:
+            return None
+        i = self.column(x, self.margin, 2)
+        if i is not None:
+            return (STOCK, WASTE)[i]
+        if self.column(x, self.foundation_x, len(SUITS)) is not None:
+            return FOUNDATION
+        return None
 
-# Типы карт
-SUITS = ['hearts', 'diamonds', 'clubs', 'spades']
-RANKS = ['A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K']
-
-
-class Card:
-    """Класс для представления игральной карты."""
+    def tableau_card(self, pos: Tuple[int, int], tableau) -> Optional[Tuple[int, int]]:
+        """Стопка tableau и номер верхней из карт под курсором."""
+        x, y = pos
+        i = self.column(x, self.margin, len(tableau))
+        if i is None or y < self.tableau_y:
+            return None
+        size = len(tableau[i].cards)
+        if not size:
+            return None
+        j = min((y - self.tableau_y) // self.gap_stack, size - 1)
+        if y - self.tableau_y > j * self.gap_stack + self.card_height:
+            return None
+        return i, j
+
+    def tableau_drop(self, pos: Tuple[int, int], tableau) -> Optional[int]:
+        """Стопка tableau, на верхнюю карту (или пустое место) которой указывает курсор."""
+        x, y = pos
+        i = self.column(x, self.margin, len(tableau))
+        if i is None:
+            return None
+        top_y = self.tableau_y + max(len(tableau[i].cards) - 1, 0) * self.gap_stack
+        if not top_y <= y <= top_y + self.card_height:
+            return None
+        return i
 
-    def __init__(self, suit: str, rank: str, face_up: bool = False):
-        self.suit = suit
-        self.rank = rank
-        self.face_up = face_up
-        self.color = RED if suit in ['hearts', 'diamonds'] else BLACK
-        self.position = (0, 0)
 
-    def __str__(self) -> str:
-        return f"{self.rank} of {self.suit}"
+layout = Layout()
 
-    def draw(self, screen: pygame.Surface, pos: Tuple[int, int]) -> None:
-        """Отрисовка карты на экране с тенью и оконтовкой."""
-        shadow_pos = (pos[0]+2, pos[1]+2)  # Смещение для тени
-        self.position = pos
 
-        # Рисуем тень (только для видимых карт)
-        if self.face_up or not self.face_up:  # Тень для всех карт
-            pygame.draw.rect(screen, (50, 50, 50), (*shadow_pos, CARD_WIDTH, CARD_HEIGHT), 0, 5)
+class Selection(NamedTuple):
+    """Взятые мышью карты: count верхних карт стопки src (WASTE или номер стопки tableau)."""
+    src: int
+    count: int
 
-        if self.face_up:
-            # Лицевая сторона с двойной оконтовкой
-            pygame.draw.rect(screen, BLACK, (*pos, CARD_WIDTH, CARD_HEIGHT), 0, 5)
-            pygame.draw.rect(screen, WHITE, (pos[0]+2, pos[1]+2, CARD_WIDTH-4, CARD_HEIGHT-4), 0, 5)
 
-            # Текст
-            font = pygame.font.SysFont('Arial', 20)
-            text = font.render(self.rank, True, self.color)
-            screen.blit(text, (pos[0] + 5, pos[1] + 5))
+class LoopStats:
+    """Счетчики главного цикла: пробуждения, выведенные кадры и загрузка CPU."""
 
-            # Масть в углу
-            small_font = pygame.font.SysFont('Arial', 14)
-            suit_text = small_font.render(self.suit[0].upper(), True, self.color)  # Первая буква масти
-            screen.blit(suit_text, (pos[0] + CARD_WIDTH - 15, pos[1] + CARD_HEIGHT - 20))
-        else:
-            # Рубашка с двойной оконтовкой
-            pygame.draw.rect(screen, BLACK, (*pos, CARD_WIDTH, CARD_HEIGHT), 0, 5)
-            pygame.draw.rect(screen, BLUE, (pos[0]+2, pos[1]+2, CARD_WIDTH-4, CARD_HEIGHT-4), 0, 5)
+    def __init__(self):
+        self.wakeups = 0
+        self.frames = 0
+        self.cpu_start = time.process_time()
+        self.wall_start = time.perf_counter()
 
-            # Узор на рубашке
-            pygame.draw.rect(screen, WHITE, (pos[0]+5, pos[1]+5, CARD_WIDTH-10, CARD_HEIGHT-10), 2, 5)
-            pygame.draw.line(screen, WHITE, (pos[0]+10, pos[1]+10),
-                             (pos[0]+CARD_WIDTH-10, pos[1]+CARD_HEIGHT-10), 2)
-            pygame.draw.line(screen, WHITE, (pos[0]+CARD_WIDTH-10, pos[1]+10),
-                             (pos[0]+10, pos[1]+CARD_HEIGHT-10), 2)
+    def report(self) -> str:
+        """Сводка по счетчикам с момента создания."""
+        wall = max(time.perf_counter() - self.wall_start, 1e-9)
+        cpu = time.process_time() - self.cpu_start
+        return (f"wakeups: {self.wakeups} ({self.wakeups / wall:.1f}/s), "
+                f"frames: {self.frames} ({self.frames / wall:.1f}/s), "
+                f"CPU: {cpu:.2f} s of {wall:.2f} s ({cpu / wall:.1%})")
 
 
 class Solitaire:
     """Класс для реализации игры 'Косынка'."""
 
-    def __init__(self):
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("Косынка")
+    def __init__(self, seed: Optional[int] = None, replay_path: Optional[str] = None,
+                 trace_path: Optional[str] = None, deals: Optional[DealLibrary] = None,
+                 difficulty: Optional[str] = None, fullscreen: bool = False,
+                 animate: bool = True):
+        self.screen = init_display(fullscreen)
+        layout.resize(self.screen.get_size())
+        fonts.clear()
+        card_art.invalidate()
         self.clock = pygame.time.Clock()
 
-        # Создаем колоду карт
-        self.deck = [Card(suit, rank) for suit in SUITS for rank in RANKS]
-        random.shuffle(self.deck)
-
-        # Инициализация стопок
-        self.stock: List[Card] = []
-        self.waste: List[Card] = []
-        self.foundations: Dict[str, List[Card]] = {suit: [] for suit in SUITS}
-        self.tableau: List[List[Card]] = [[] for _ in range(7)]
-        self.selected_cards: Optional[List[Card]] = None
-        self.selected_stack: Optional[str] = None
+        # Состояние последнего выведенного кадра для перерисовки по областям
+        self.drawn_regions: Dict[Tuple[str, int], Tuple[tuple, pygame.Rect]] = {}
+        self.drawn_drag_rect: Optional[pygame.Rect] = None
+        self.drawn_flights: Dict[Tuple[Card, bool], pygame.Rect] = {}
+        # Области, выведенные последней перерисовкой
+        self.updated_rects: List[pygame.Rect] = []
+        self.full_redraw = True
+
+        # Перелеты карт: позиция партии меняется сразу, а карта летит к
+        # новому месту и до конца перелета не рисуется в стопке
+        self.animator = Animator() if animate else None
+        self.flying = self.animator.flights if self.animator else {}
+
+        # Счетчик изменений состояния: проверки конца игры выполняются
+        # только после ходов
+        self.state_version = 0
+
+        # Архив, в который записываются сыгранные партии
+        self.replay_path = replay_path
+
+        # Подсказки ищутся в фоновом процессе и приходят событием HINT_EVENT
+        self.hints = HintService(self.post_hint)
+
+        # Замер фаз главного цикла: включается оверлеем (F3) или файлом
+        # трассировки, в остальное время профайлера нет
+        self.profiler = FrameProfiler(trace_path) if trace_path else None
+        self.show_profile = False
+
+        # Библиотека решаемых раскладов (deals.py), из которой берутся новые партии
+        self.deals = deals
+        self.difficulty = difficulty
+        self.new_game(seed)
+
+    def new_game(self, seed: Optional[int] = None) -> None:
+        """Раздает новую партию; окно и кэш карт остаются прежними.
+
+        Расклад задается seed и воспроизводится при запуске с тем же --seed.
+        По умолчанию берется случайный решаемый расклад из библиотеки, а без
+        нее - случайный seed.
+        """
+        deal = None
+        if seed is None and self.deals is not None:
+            deal = self.deals.sample(self.difficulty)
+            if deal is not None:
+                seed = deal.seed
+        self.seed = random.randrange(SEED_LIMIT) if seed is None else seed
+        caption = f"Косынка - расклад {self.seed}"
+        pygame.display.set_caption(f"{caption} ({deal.group_name})" if deal else caption)
+
+        # Состояние партии; интерфейс только отображает его
+        self.game = Game(shuffled_deck(self.seed))
+        self.history = History()
+        self.selection: Optional[Selection] = None
         self.drag_pos: Optional[Tuple[int, int]] = None
-
-        # Раздача карт в tableau
-        for i in range(7):
-            for j in range(i + 1):
-                card = self.deck.pop()
-                card.face_up = (j == i)  # Последняя карта в каждой стопке открыта
-                self.tableau[i].append(card)
-
-        # Оставшиеся карты идут в сток
-        self.stock = self.deck.copy()
+        self.state_changed()
+        if self.animator:
+            self.animate_deal()
+
+    def state_changed(self) -> None:
+        """Отмечает изменение позиции: показанная подсказка и ее поиск устаревают."""
+        self.state_version += 1
+        self.hint: Optional[Move] = None
+        self.hints.cancel()
+
+    def request_hint(self) -> None:
+        """Запрашивает подсказку для текущей позиции."""
+        hint = self.hints.request(self.game)
+        if hint is not None:
+            self.show_hint(hint)
+
+    def post_hint(self, hint: Hint) -> None:
+        """Передает найденную подсказку в главный цикл (вызывается из другого потока)."""
+        pygame.event.post(pygame.event.Event(HINT_EVENT, hint=hint))
+
+    def show_hint(self, hint: Hint) -> None:
+        """Показывает подсказку, если она относится к текущей позиции."""
+        if hint.key == self.game.key():
+            self.hint = hint.move
+
+    def save_replay(self) -> None:
+        """Дописывает текущую партию в архив записей, если он задан."""
+        if self.replay_path and self.history.done:
+            append_replay(self.replay_path, replay_of(self.seed, self.game, self.history))
 
     def reset_game(self) -> None:
         """Сбрасывает игру в начальное состояние."""
-        self.__init__()
-
-    def draw_game(self) -> None:
-        """Отрисовка всех элементов игры."""
-        self.screen.fill(GREEN)
-
-        # Рисуем сток и отбой
-        self.draw_stock_and_waste()
-
-        # Рисуем фундаменты (дома)
-        self.draw_foundations()
-
-        # Рисуем tableau (игровые стопки)
-        self.draw_tableau()
-
-        # Рисуем перетаскиваемые карты
-        if self.selected_cards and self.drag_pos:
-            dx, dy = self.drag_pos
-            for i, card in enumerate(self.selected_cards):
-                card.draw(self.screen, (dx, dy + i * CARD_GAP // 2))
-
-        pygame.display.flip()
-
-    def has_possible_moves(self) -> bool:
-        """Проверяет, есть ли возможные ходы в текущей позиции."""
-        # 1. Проверяем ходы из отбоя (waste)
-        if self.waste:
-            top_waste = self.waste[-1]
-            # Можно ли положить в фундамент?
-            if self.can_move_to_foundation(top_waste):
-                return True
-            # Можно ли положить в tableau?
-            for i in range(7):
-                if self.can_move_to_tableau(top_waste, i):
-                    return True
-
-        # 2. Проверяем ходы из tableau
-        for i, pile in enumerate(self.tableau):
-            if not pile:
-                continue
-
-            # Находим первую открытую карту в стопке
-            open_cards = [card for card in pile if card.face_up]
-            if not open_cards:
-                continue
-
-            top_tableau_card = open_cards[-1]  # Берем самую верхнюю открытую
-
-            # Можно ли положить в фундамент?
-            if self.can_move_to_foundation(top_tableau_card):
-                return True
-
-            # Можно ли переместить в другую стопку tableau?
-            for j in range(7):
-                if i == j:
-                    continue  # Не проверяем перемещение в ту же стопку
-                if self.can_move_to_tableau(top_tableau_card, j):
-                    return True
-
-        # 3. Проверяем можно ли взять карту из стока
-        if self.stock or (not self.stock and self.waste):
-            return True
-
-        # 4. Проверяем можно ли переместить карты между стопками tableau
-        for i, pile in enumerate(self.tableau):
-            if len(pile) <= 1:
-                continue
+        self.save_replay()
+        self.new_game()
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Требует полной перерисовки экрана в следующем кадре."""
+        self.full_redraw = True
+
+    def resize(self) -> None:
+        """Подстраивает стол под новый размер окна."""
+        self.screen = pygame.display.get_surface()
+        layout.resize(self.screen.get_size())
+        if self.animator:
+            self.animator.clear()  # координаты перелетов устарели
+        self.invalidate()
+
+    def draw_game(self) -> bool:
+        """Перерисовка изменившихся областей экрана.
+
+        Сравнивает состояние стопок и перетаскиваемых карт с последним
+        выведенным кадром, перерисовывает только изменившиеся области поверх
+        закэшированного сукна и выводит их через pygame.display.update.
+        Возвращает True, если на экран что-то было выведено.
+        """
+        if card_art.validate(layout.scale):
+            self.full_redraw = True
+
+        # Сначала перелеты: долетевшие карты снова рисуются в своих стопках
+        flights = self.animator.frame() if self.animator else []
+        regions = self.get_regions()
+        drag_rect = self.get_drag_rect()
+        art_size = layout.art_size
+        # Ключ - карта и сторона: перевернутая на месте карта тоже перерисовывается
+        flight_rects = {(card, face_up): pygame.Rect(pos, art_size)
+                        for card, face_up, pos in flights}
+
+        if self.full_redraw:
+            dirty = [self.screen.get_rect()]
+            self.full_redraw = False
+        else:
+            dirty = []
+            for key, (state, rect) in regions.items():
+                drawn = self.drawn_regions.get(key)
+                if drawn is None:
+                    dirty.append(rect)
+                elif drawn[0] != state:
+                    dirty.append(rect.union(drawn[1]))
+            # Исчезнувшие области (например, снятая подсказка)
+            dirty.extend(rect for key, (_, rect) in self.drawn_regions.items()
+                         if key not in regions)
+
+            # Область, которую заметают перетаскиваемые карты
+            if drag_rect != self.drawn_drag_rect:
+                old_rect = self.drawn_drag_rect
+                if old_rect and drag_rect and old_rect.colliderect(drag_rect):
+                    dirty.append(old_rect.union(drag_rect))
+                else:
+                    dirty.extend(rect for rect in (old_rect, drag_rect) if rect)
+
+            # Летящие карты: прежнее и новое место каждой сдвинувшейся карты
+            for key, rect in self.drawn_flights.items():
+                if flight_rects.get(key) != rect:
+                    dirty.append(rect)
+            dirty.extend(rect for key, rect in flight_rects.items()
+                         if self.drawn_flights.get(key) != rect)
+            if len(dirty) > MAX_DIRTY_RECTS:
+                dirty = [dirty[0].unionall(dirty)]
+
+        self.drawn_regions = regions
+        self.drawn_drag_rect = drag_rect
+        self.drawn_flights = flight_rects
+        self.updated_rects = dirty
+        if not dirty:
+            return False
 
-            # Ищем последовательности карт, которые можно переместить
-            open_cards = [card for card in pile if card.face_up]
-            if len(open_cards) < 2:
-                continue
+        sprites = [(card_art.surface(card, face_up), pos) for card, face_up, pos in flights]
+        sprite_rects = list(flight_rects.values())
+
+        for rect in dirty:
+            self.screen.set_clip(rect)
+            self.screen.blit(card_art.felt, rect, rect)
+            for key, (_, region_rect) in regions.items():
+                if region_rect.colliderect(rect):
+                    self.draw_region(key)
+            if sprites:
+                self.screen.blits([sprites[k] for k in rect.collidelistall(sprite_rects)],
+                                  doreturn=False)
+            if drag_rect and drag_rect.colliderect(rect):
+                self.draw_dragged_cards()
+        self.screen.set_clip(None)
+
+        if self.profiler:
+            self.profiler.mark('draw')
+        pygame.display.update(dirty)
+        return True
 
-            # Проверяем можно ли переместить последовательность в другую стопку
-            for j in range(7):
-                if i == j:
-                    continue
-                if self.can_move_to_tableau(open_cards[0], j):
-                    return True
+    def get_regions(self) -> Dict[Tuple[str, int], Tuple[tuple, pygame.Rect]]:
+        """Состояние и занимаемый прямоугольник каждой области стола.
+
+        Состояние включает только то, что видно на экране: при его изменении
+        область нужно перерисовать.
+        """
+        regions = {}
+        card_size = layout.art_size  # вместе с тенью
+        flying = self.flying
+
+        regions[('stock', 0)] = ((bool(self.game.stock),), pygame.Rect(layout.stock_pos, card_size))
+
+        regions[('waste', 0)] = ((self.waste_top(),), pygame.Rect(layout.waste_pos, card_size))
+
+        for i in range(len(SUITS)):
+            regions[('foundation', i)] = ((self.foundation_visible(i),),
+                                          pygame.Rect(layout.foundation_pos(i), card_size))
+
+        for i, pile in enumerate(self.game.tableau):
+            # Внутри стопки карты меняются только сверху, поэтому достаточно
+            # длины стопки, верхней карты, числа закрытых карт и карт, которые
+            # еще летят на свои места в стопке
+            cards = pile.cards
+            state = (len(cards), cards[-1], pile.hidden) if cards else (0,)
+            if flying:
+                state += tuple(card for card in cards if card in flying)
+            height = card_size[1] + max(len(cards) - 1, 0) * layout.gap_stack
+            regions[('tableau', i)] = (state, pygame.Rect(layout.tableau_pos(i),
+                                                          (card_size[0], height)))
+
+        # Подсказка рисуется поверх карт: откуда и куда сделать ход
+        if self.hint is not None:
+            for i, rect in enumerate(self.get_hint_rects(self.hint)):
+                regions[('hint', i)] = ((self.hint,), rect)
+
+        if self.show_profile:
+            regions[('profile', 0)] = (self.profiler.overlay_lines, layout.profile_rect)
+        return regions
+
+    def get_hint_rects(self, move: Move) -> List[pygame.Rect]:
+        """Прямоугольники карт, которые берет ход, и места, куда они кладутся."""
+        src, count, dst = move
+        card_size = layout.card_size
+        if src == STOCK:
+            src_rect = pygame.Rect(layout.stock_pos, card_size)
+        elif src == WASTE:
+            src_rect = pygame.Rect(layout.waste_pos, card_size)
+        else:
+            cards = self.game.tableau[src].cards
+            src_rect = pygame.Rect(layout.tableau_pos(src, len(cards) - count),
+                                   (layout.card_width,
+                                    layout.card_height + (count - 1) * layout.gap_stack))
+        if dst == WASTE:
+            dst_pos = layout.waste_pos
+        elif dst == FOUNDATION:
+            dst_pos = layout.foundation_pos(CARD_SUIT[self.game.top_cards(src)[-1]])
+        else:
+            dst_pos = layout.tableau_pos(dst, max(len(self.game.tableau[dst].cards) - 1, 0))
+        return [src_rect, pygame.Rect(dst_pos, card_size)]
+
+    def get_drag_rect(self) -> Optional[pygame.Rect]:
+        """Прямоугольник, занимаемый перетаскиваемыми картами."""
+        if not (self.selection and self.drag_pos):
+            return None
+        width, height = layout.art_size
+        height += (self.selection.count - 1) * layout.drag_gap
+        return pygame.Rect(self.drag_pos, (width, height))
+
+    def draw_region(self, key: Tuple[str, int]) -> None:
+        """Отрисовка одной области стола."""
+        name, i = key
+        if name == 'stock':
+            self.draw_stock()
+        elif name == 'waste':
+            self.draw_waste()
+        elif name == 'foundation':
+            self.draw_foundation(i)
+        elif name == 'hint':
+            rect = self.get_hint_rects(self.hint)[i]
+            pygame.draw.rect(self.screen, YELLOW, rect, 3, 5)
+        elif name == 'profile':
+            self.draw_profile()
+        else:
+            self.draw_tableau_pile(i)
+
+    def draw_profile(self) -> None:
+        """Отрисовка оверлея с процентилями времен фаз цикла, мс."""
+        font = fonts.get('monospace', 14)
+        rect = layout.profile_rect
+        panel = pygame.Surface(rect.size, pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 160))
+        self.screen.blit(panel, rect)
+        x, y = rect.x + 8, rect.y + 6
+        for row, line in enumerate(self.profiler.overlay_lines):
+            # Имя фазы слева, числа выровнены по правому краю колонок
+            name, *values = line.split()
+            self.screen.blit(font.render(name, True, WHITE), (x, y + row * 15))
+            for k, value in enumerate(values):
+                text = font.render(value, True, WHITE)
+                self.screen.blit(text, (x + 120 + k * 45 - text.get_width(), y + row * 15))
+
+    def toggle_profile(self) -> None:
+        """Показывает или скрывает оверлей замера фаз цикла.
+
+        Без файла трассировки профайлер существует, только пока виден оверлей.
+        """
+        self.show_profile = not self.show_profile
+        if self.show_profile and self.profiler is None:
+            self.profiler = FrameProfiler()
+        elif not self.show_profile and self.profiler.trace is None:
+            self.profiler = None
+
+    def draw_dragged_cards(self) -> None:
+        """Отрисовка перетаскиваемых карт."""
+        dx, dy = self.drag_pos
+        for i, card in enumerate(self.selected_cards()):
+            self.screen.blit(card_art.surface(card), (dx, dy + i * layout.drag_gap))
+
+    def draw_stock(self) -> None:
+        """Отрисовка стока."""
+        if self.game.stock:
+            self.screen.blit(card_art.stock_slot, layout.stock_pos)
+        else:
+            self.screen.blit(card_art.empty_slot, layout.stock_pos)
 
-        return False
+    def waste_top(self) -> Optional[Card]:
+        """Видимая верхняя карта отбоя (не летящая)."""
+        for card in reversed(self.game.waste):
+            if card not in self.flying:
+                return card
+        return None
 
-    def draw_stock_and_waste(self) -> None:
-        """Отрисовка стока и отбоя."""
-        # Сток
-        stock_pos = (MARGIN, MARGIN)
-        if self.stock:
-            pygame.draw.rect(self.screen, WHITE, (*stock_pos, CARD_WIDTH, CARD_HEIGHT), 0, 5)
-            pygame.draw.rect(self.screen, BLACK, (*stock_pos, CARD_WIDTH, CARD_HEIGHT), 2, 5)
+    def foundation_visible(self, i: int) -> int:
+        """Число видимых карт фундамента i: верхние могут еще лететь в него."""
+        count = self.game.foundations[i]
+        while count and i * len(RANKS) + count - 1 in self.flying:
+            count -= 1
+        return count
+
+    def draw_waste(self) -> None:
+        """Отрисовка отбоя."""
+        top = self.waste_top()
+        if top is not None:
+            self.screen.blit(card_art.surface(top), layout.waste_pos)
+
+    def draw_foundation(self, i: int) -> None:
+        """Отрисовка фундамента (дома)."""
+        pos = layout.foundation_pos(i)
+        count = self.foundation_visible(i)
+        if count:
+            self.screen.blit(card_art.surface(i * len(RANKS) + count - 1), pos)
         else:
-            pygame.draw.rect(self.screen, GREEN, (*stock_pos, CARD_WIDTH, CARD_HEIGHT), 2, 5)
-
-        # Отбой
-        waste_pos = (MARGIN + CARD_WIDTH + MARGIN, MARGIN)
-        if self.waste:
-            self.waste[-1].draw(self.screen, waste_pos)
-
-    def draw_foundations(self) -> None:
-        """Отрисовка фундаментов (домов)."""
-        for i, suit in enumerate(SUITS):
-            pos = (MARGIN * 3 + CARD_WIDTH * 3 + i * (CARD_WIDTH + MARGIN), MARGIN)
-            if self.foundations[suit]:
-                self.foundations[suit][-1].draw(self.screen, pos)
-            else:
-                pygame.draw.rect(self.screen, GREEN, (*pos, CARD_WIDTH, CARD_HEIGHT), 2, 5)
+            self.screen.blit(card_art.empty_slot, pos)
 
-    def draw_tableau(self) -> None:
-        """Отрисовка игровых стопок (tableau)."""
-        for i, pile in enumerate(self.tableau):
-            for j, card in enumerate(pile):
-                pos = (MARGIN + i * (CARD_WIDTH + MARGIN),
-                       MARGIN * 2 + CARD_HEIGHT + j * CARD_GAP_STACK)
-                card.draw(self.screen, pos)
+    def draw_tableau_pile(self, i: int) -> None:
+        """Отрисовка игровой стопки (tableau) одним вызовом blits."""
+        pile = self.game.tableau[i]
+        flying = self.flying
+        self.screen.blits([(card_art.surface(card, j >= pile.hidden), layout.tableau_pos(i, j))
+                           for j, card in enumerate(pile.cards) if card not in flying],
+                          doreturn=False)
 
     def deal_from_stock(self) -> None:
         """Взять карты из стока в отбой."""
-        if self.stock:
-            card = self.stock.pop()
-            card.face_up = True
-            self.waste.append(card)
-        else:
-            # Если сток пуст, переворачиваем отбой обратно в сток
-            self.stock = self.waste[::-1]
-            for card in self.stock:
-                card.face_up = False
-            self.waste = []
-
-    def get_card_at_pos(self, pos: Tuple[int, int]) -> Optional[Tuple[Card, str, int]]:
-        """Получить карту по позиции на экране."""
-        x, y = pos
-
-        # Проверяем отбой
-        waste_pos = (MARGIN + CARD_WIDTH + MARGIN, MARGIN)
-        if (waste_pos[0] <= x <= waste_pos[0] + CARD_WIDTH and
-                waste_pos[1] <= y <= waste_pos[1] + CARD_HEIGHT and
-                self.waste):
-            return (self.waste[-1], 'waste', -1)
-
-        # Проверяем tableau
-        for i, pile in enumerate(self.tableau):
-            if pile:
-                last_card_pos = (MARGIN + i * (CARD_WIDTH + MARGIN),
-                                 MARGIN * 2 + CARD_HEIGHT + (len(pile) - 1) * CARD_GAP_STACK)
-                if (last_card_pos[0] <= x <= last_card_pos[0] + CARD_WIDTH and
-                        last_card_pos[1] <= y <= last_card_pos[1] + CARD_HEIGHT):
-                    return (pile[-1], 'tableau', i)
-
-        return None
-
-    def get_cards_from_tableau(self, pile_idx: int, card: Card) -> Optional[List[Card]]:
-        """Получить карты из tableau начиная с указанной."""
-        pile = self.tableau[pile_idx]
-        if card in pile:
-            idx = pile.index(card)
-            return pile[idx:]
+        self.play(DEAL)
+
+    def get_card_at_pos(self, pos: Tuple[int, int]) -> Optional[Tuple[Card, int]]:
+        """Верхняя карта под курсором и ее стопка (WASTE или номер стопки tableau)."""
+        if layout.top_slot(pos) == WASTE:
+            if self.game.waste:
+                return (self.game.waste[-1], WASTE)
+            return None
+
+        # Проверяем верхние карты tableau
+        i = layout.tableau_drop(pos, self.game.tableau)
+        if i is not None and self.game.tableau[i].cards:
+            return (self.game.tableau[i].cards[-1], i)
         return None
 
-    def can_move_to_foundation(self, card: Card) -> bool:
-        """Можно ли переместить карту в фундамент."""
-        foundation = self.foundations[card.suit]
-        if card.rank == 'A' and not foundation:
-            return True
-        elif foundation:
-            last_card = foundation[-1]
-            current_idx = RANKS.index(card.rank)
-            last_idx = RANKS.index(last_card.rank)
-            return current_idx == last_idx + 1
-        return False
+    def selected_cards(self) -> bytearray:
+        """Взятые карты (сверху стопки-источника)."""
+        sel = self.selection
+        return self.game.top_cards(sel.src)[-sel.count:] if sel else bytearray()
 
-    def can_move_to_tableau(self, card: Card, pile_idx: int) -> bool:
-        """Можно ли переместить карту в указанную стопку tableau."""
-        pile = self.tableau[pile_idx]
-        if not pile:
-            return card.rank == 'K'
-        else:
-            top_card = pile[-1]
-            return (card.color != top_card.color and
-                    RANKS.index(card.rank) == RANKS.index(top_card.rank) - 1)
-
-    def move_to_foundation(self, card: Card) -> bool:
-        """Переместить карту в фундамент."""
-        if self.can_move_to_foundation(card):
-            # Удаляем карту из текущего места
-            if self.selected_stack == 'waste' and self.waste and self.waste[-1] == card:
-                self.waste.pop()
-            elif self.selected_stack == 'tableau' and self.selected_cards:
-                pile_idx = self.tableau.index(self.selected_cards[0].position[0] // (CARD_WIDTH + MARGIN))
-                for c in self.selected_cards:
-                    if c in self.tableau[pile_idx]:
-                        self.tableau[pile_idx].remove(c)
-
-            # Добавляем в фундамент
-            self.foundations[card.suit].append(card)
-            return True
-        return False
+    def select(self, src: int, count: int, pos: Tuple[int, int]) -> None:
+        """Взять count верхних карт стопки src; карты следуют за курсором."""
+        self.selection = Selection(src, count)
+        self.drag_pos = (pos[0] - layout.card_width // 2, pos[1] - layout.card_height // 2)
 
-    def move_to_tableau(self, cards: List[Card], pile_idx: int) -> bool:
-        """Переместить карты в указанную стопку tableau."""
-        if not cards:
-            return False
+    def clear_selection(self) -> None:
+        """Отпустить взятые карты."""
+        self.selection = None
+        self.drag_pos = None
 
-        first_card = cards[0]
-        if self.can_move_to_tableau(first_card, pile_idx):
-            # Удаляем карты из текущего места
-            if self.selected_stack == 'waste' and self.waste and self.waste[-1] == first_card and len(cards) == 1:
-                self.waste.pop()
-            elif self.selected_stack == 'tableau' and self.selected_cards:
-                # Находим исходную стопку, проверяя в какой стопке находится первая карта
-                source_pile_idx = None
-                for i, pile in enumerate(self.tableau):
-                    if cards[0] in pile:
-                        source_pile_idx = i
-                        break
-
-                if source_pile_idx is not None:
-                    for c in self.selected_cards:
-                        if c in self.tableau[source_pile_idx]:
-                            self.tableau[source_pile_idx].remove(c)
-
-            # Добавляем в целевую стопку
-            self.tableau[pile_idx].extend(cards)
-
-            # Открываем последнюю карту в исходной стопке, если нужно
-            if self.selected_stack == 'tableau' and source_pile_idx is not None and source_pile_idx != pile_idx:
-                if self.tableau[source_pile_idx] and not self.tableau[source_pile_idx][-1].face_up:
-                    self.tableau[source_pile_idx][-1].face_up = True
-            return True
-        return False
+    def change(self, action: Callable[[], bool], delay: float = 0.0) -> bool:
+        """Меняет позицию действием action; сдвинутые карты летят на новые места.
 
-    def check_win(self) -> bool:
-        """Проверка, выиграна ли игра."""
-        for suit in SUITS:
-            if len(self.foundations[suit]) != len(RANKS):
-                return False
+        Возвращает результат action: False, если позиция не изменилась.
+        """
+        before = self.card_positions() if self.animator else None
+        if not action():
+            return False
+        self.state_changed()
+        if before is not None:
+            self.animate_changes(before, delay)
         return True
 
+    def play(self, move: Move, delay: float = 0.0) -> bool:
+        """Сделать ход; возвращает False, если ход недопустим."""
+        return self.change(lambda: self.history.play(self.game, move), delay)
+
+    def undo(self) -> bool:
+        """Отменить последний ход."""
+        self.clear_selection()
+        return self.change(lambda: self.history.undo(self.game))
+
+    def redo(self) -> bool:
+        """Повторить отмененный ход."""
+        self.clear_selection()
+        return self.change(lambda: self.history.redo(self.game))
+
+    def auto_move(self) -> bool:
+        """Переносит в фундамент все карты, которые туда можно положить (правый клик)."""
+        self.clear_selection()
+        moved = 0
+        progress = True
+        while progress:
+            progress = False
+            for src in SOURCES:
+                if self.play(Move(src, 1, FOUNDATION), moved * AUTO_MOVE_STAGGER):
+                    moved += 1
+                    progress = True
+        return moved > 0
+
+    def card_positions(self) -> Dict[Card, Tuple[Point, bool]]:
+        """Место каждой карты на столе и лежит ли она лицом вверх."""
+        positions = {}
+        for i, pile in enumerate(self.game.tableau):
+            for j, card in enumerate(pile.cards):
+                positions[card] = (layout.tableau_pos(i, j), j >= pile.hidden)
+        for card in self.game.waste:
+            positions[card] = (layout.waste_pos, True)
+        for card in self.game.stock:
+            positions[card] = (layout.stock_pos, False)
+        for suit, count in enumerate(self.game.foundations):
+            for rank in range(count):
+                positions[suit * len(RANKS) + rank] = (layout.foundation_pos(suit), True)
+        return positions
+
+    def animate_changes(self, before: Dict[Card, Tuple[Point, bool]],
+                        delay: float = 0.0) -> None:
+        """Запускает перелет карт, место которых изменилось, с прежних мест на новые.
+
+        Карта, которая уже летит на свое место, летит дальше по прежнему
+        расписанию; летящая в другое место продолжает полет с текущего положения.
+        """
+        now = self.animator.clock()
+        flying = self.flying
+        for card, (end, face_up) in self.card_positions().items():
+            flight = flying.get(card)
+            if flight is None:
+                start = before[card][0]
+            elif flight.end == end:
+                if flight.face_up != face_up:
+                    flying[card] = flight._replace(face_up=face_up)
+                continue
+            else:
+                start = self.animator.position(card, now)
+            if start != end:
+                self.animator.add(card, face_up, start, end, delay, now=now)
+
+    def animate_from(self, starts: Dict[Card, Point]) -> None:
+        """Запускает перелет карт с положений starts на их места."""
+        now = self.animator.clock()
+        positions = self.card_positions()
+        for card, start in starts.items():
+            end, face_up = positions[card]
+            self.animator.add(card, face_up, start, end, now=now)
+
+    def animate_deal(self) -> None:
+        """Раздача: карты tableau по очереди летят из стока на свои места."""
+        self.animator.clear()
+        now = self.animator.clock()
+        tableau = self.game.tableau
+        k = 0
+        for j in range(len(tableau)):
+            for i in range(j, len(tableau)):
+                pile = tableau[i]
+                self.animator.add(pile.cards[j], j >= pile.hidden, layout.stock_pos,
+                                  layout.tableau_pos(i, j), k * DEAL_STAGGER, now=now)
+                k += 1
+
+    def win_cascade(self, stagger: float = CASCADE_STAGGER) -> None:
+        """Выигрыш: карты по очереди (начиная с королей) вылетают из фундаментов за экран."""
+        now = self.animator.clock()
+        width, height = self.screen.get_size()
+        rng = random.Random(self.seed)
+        for k in range(DECK_SIZE):
+            suit, rank = k % len(SUITS), KING - k // len(SUITS)
+            card = suit * len(RANKS) + rank
+            start = self.animator.position(card, now) or layout.foundation_pos(suit)
+            end = (rng.randrange(-layout.card_width, width), height + layout.card_height)
+            self.animator.add(card, True, start, end, k * stagger, CASCADE_DURATION,
+                              lift=rng.uniform(0.2, 0.6) * height, ease=linear, now=now)
+
     def handle_click(self, pos: Tuple[int, int]) -> None:
         """Обработка клика мыши."""
-        x, y = pos
-
-        # Проверяем клик по стоку
-        stock_pos = (MARGIN, MARGIN)
-        if (stock_pos[0] <= x <= stock_pos[0] + CARD_WIDTH and
-                stock_pos[1] <= y <= stock_pos[1] + CARD_HEIGHT):
+        # Проверяем клик по стоку и отбою
+        slot = layout.top_slot(pos)
+        if slot == STOCK:
             self.deal_from_stock()
             return
-
-        # Проверяем клик по отбою
-        waste_pos = (MARGIN + CARD_WIDTH + MARGIN, MARGIN)
-        if (waste_pos[0] <= x <= waste_pos[0] + CARD_WIDTH and
-                waste_pos[1] <= y <= waste_pos[1] + CARD_HEIGHT and
-                self.waste):
-            self.selected_cards = [self.waste[-1]]
-            self.selected_stack = 'waste'
-            self.drag_pos = (x - CARD_WIDTH // 2, y - CARD_HEIGHT // 2)
+        if slot == WASTE:
+            if self.game.waste:
+                self.select(WASTE, 1, pos)
             return
 
-        # Проверяем клик по tableau
-        for i, pile in enumerate(self.tableau):
-            if not pile:
-                continue
-
-            # Проверяем клик по последней карте в стопке
-            last_card_pos = (MARGIN + i * (CARD_WIDTH + MARGIN),
-                             MARGIN * 2 + CARD_HEIGHT + (len(pile) - 1) * CARD_GAP_STACK)
-            if (last_card_pos[0] <= x <= last_card_pos[0] + CARD_WIDTH and
-                    last_card_pos[1] <= y <= last_card_pos[1] + CARD_HEIGHT):
-                clicked_card = pile[-1]
-                if clicked_card.face_up:
-                    self.selected_cards = [clicked_card]
-                    self.selected_stack = 'tableau'
-                    self.drag_pos = (x - CARD_WIDTH // 2, y - CARD_HEIGHT // 2)
-                return
-
-            # Проверяем клик по другим картам в стопке
-            for j, card in enumerate(pile):
-                if not card.face_up:
-                    continue
-
-                card_pos = (MARGIN + i * (CARD_WIDTH + MARGIN),
-                            MARGIN * 2 + CARD_HEIGHT + j * CARD_GAP_STACK)
-                if (card_pos[0] <= x <= card_pos[0] + CARD_WIDTH and
-                        card_pos[1] <= y <= card_pos[1] + CARD_HEIGHT):
-                    self.selected_cards = pile[j:]
-                    self.selected_stack = 'tableau'
-                    self.drag_pos = (x - CARD_WIDTH // 2, y - CARD_HEIGHT // 2)
-                    return
+        # Проверяем клик по tableau: берется карта под курсором и все карты на ней
+        hit = layout.tableau_card(pos, self.game.tableau)
+        if hit is None:
+            return
+        i, j = hit
+        pile = self.game.tableau[i]
+        if j >= pile.hidden:
+            self.select(i, len(pile.cards) - j, pos)
 
     def handle_drop(self, pos: Tuple[int, int]) -> None:
         """Обработка отпускания карты (после перетаскивания)."""
-        if not self.selected_cards or not self.selected_stack:
+        sel = self.selection
+        if sel is None:
             return
+        starts = {}
+        if self.animator and self.drag_pos:
+            dx, dy = self.drag_pos
+            starts = {card: (dx, dy + i * layout.drag_gap)
+                      for i, card in enumerate(self.selected_cards())}
+        self.clear_selection()
 
-        x, y = pos
+        # Сброс на фундамент или на верхнюю карту стопки tableau
+        if layout.top_slot(pos) == FOUNDATION:
+            self.play(Move(sel.src, sel.count, FOUNDATION))
+        else:
+            dst = layout.tableau_drop(pos, self.game.tableau)
+            if dst is not None:
+                self.play(Move(sel.src, sel.count, dst))
 
-        # Проверяем сброс на фундамент
-        for i, suit in enumerate(SUITS):
-            foundation_pos = (MARGIN * 3 + CARD_WIDTH * 3 + i * (CARD_WIDTH + MARGIN), MARGIN)
-            if (foundation_pos[0] <= x <= foundation_pos[0] + CARD_WIDTH and
-                    foundation_pos[1] <= y <= foundation_pos[1] + CARD_HEIGHT):
-                if len(self.selected_cards) == 1 and self.move_to_foundation(self.selected_cards[0]):
-                    self.selected_cards = None
-                    self.selected_stack = None
-                    self.drag_pos = None
-                    return
-
-        # Проверяем сброс на tableau
-        for i in range(7):
-            pile_pos_x = MARGIN + i * (CARD_WIDTH + MARGIN)
-            pile_pos_y = MARGIN * 2 + CARD_HEIGHT
-
-            # Если стопка пуста, проверяем сброс короля
-            if not self.tableau[i]:
-                if (pile_pos_x <= x <= pile_pos_x + CARD_WIDTH and
-                        pile_pos_y <= y <= pile_pos_y + CARD_HEIGHT and
-                        self.selected_cards[0].rank == 'K'):
-                    self.move_to_tableau(self.selected_cards, i)
-                    self.selected_cards = None
-                    self.selected_stack = None
-                    self.drag_pos = None
-                    return
-            else:
-                # Проверяем сброс на последнюю карту в стопке
-                last_card_pos = (pile_pos_x,
-                                 pile_pos_y + (len(self.tableau[i]) - 1) * CARD_GAP_STACK)
-                if (last_card_pos[0] <= x <= last_card_pos[0] + CARD_WIDTH and
-                        last_card_pos[1] <= y <= last_card_pos[1] + CARD_HEIGHT):
-                    if self.move_to_tableau(self.selected_cards, i):
-                        self.selected_cards = None
-                        self.selected_stack = None
-                        self.drag_pos = None
-                        return
-
-        # Если сброс не на допустимую цель, сбрасываем выделение
-        self.selected_cards = None
-        self.selected_stack = None
-        self.drag_pos = None
+        # Отпущенные карты летят на новое место или возвращаются на прежнее
+        if starts:
+            self.animate_from(starts)
 
     def show_game_over_message(self) -> bool:
         """Показывает сообщение о конце игры и спрашивает, начать заново."""
-        font = pygame.font.SysFont('Arial', 36)
+        font = fonts.get('arial', scaled(36, layout.scale))
         text = font.render("Нет возможных ходов!", True, WHITE)
         restart_text = font.render("Начать заново? (Y/N)", True, WHITE)
 
         # Создаем полупрозрачную поверхность
-        s = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+        width, height = self.screen.get_size()
+        s = pygame.Surface((width, height), pygame.SRCALPHA)
         s.fill((0, 0, 0, 180))  # Черный с прозрачностью
         self.screen.blit(s, (0, 0))
 
         # Отображаем текст
-        self.screen.blit(text, (SCREEN_WIDTH//2 - text.get_width()//2, SCREEN_HEIGHT//2 - 50))
-        self.screen.blit(restart_text, (SCREEN_WIDTH//2 - restart_text.get_width()//2, SCREEN_HEIGHT//2 + 10))
+        self.screen.blit(text, (width//2 - text.get_width()//2,
+                                height//2 - scaled(50, layout.scale)))
+        self.screen.blit(restart_text, (width//2 - restart_text.get_width()//2,
+                                        height//2 + scaled(10, layout.scale)))
         pygame.display.flip()
 
         # Ждем ответа пользователя
@@ -477,74 +1027,207 @@ class Solitaire:
 
         return False
 
-    def show_message(self, text: str) -> None:
-        """Отображает сообщение поверх игры."""
+    def show_message(self, text: str, rects: Optional[List[pygame.Rect]] = None) -> None:
+        """Отображает сообщение поверх игры.
+
+        rects - области, перерисованные под уже показанным сообщением: затемнение
+        накладывается только на них, иначе остальной экран затемнился бы повторно.
+        """
         # Создаем полупрозрачное затемнение
-        s = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+        width, height = self.screen.get_size()
+        s = pygame.Surface((width, height), pygame.SRCALPHA)
         s.fill((0, 0, 0, 180))
-        self.screen.blit(s, (0, 0))
 
-        # Отображаем текст
-        font = pygame.font.SysFont('Arial', 36)
+        font = fonts.get('arial', scaled(36, layout.scale))
         text_surface = font.render(text, True, WHITE)
-        self.screen.blit(text_surface,
-                         (SCREEN_WIDTH//2 - text_surface.get_width()//2,
-                          SCREEN_HEIGHT//2 - text_surface.get_height()//2))
-
-        pygame.display.flip()
-
-    def run(self) -> None:
-        """Основной игровой цикл."""
+        text_pos = (width//2 - text_surface.get_width()//2,
+                    height//2 - text_surface.get_height()//2)
+
+        for rect in rects or [self.screen.get_rect()]:
+            self.screen.set_clip(rect)
+            self.screen.blit(s, (0, 0))
+            # Отображаем текст
+            self.screen.blit(text_surface, text_pos)
+        self.screen.set_clip(None)
+
+        if rects:
+            pygame.display.update(rects)
+        else:
+            pygame.display.flip()
+
+    def is_animating(self) -> bool:
+        """Нужны ли непрерывные кадры (идет перетаскивание или анимация)."""
+        return self.drag_pos is not None or bool(self.flying)
+
+    def wait_events(self, event_driven: bool) -> List[pygame.event.Event]:
+        """Ожидание событий главного цикла.
+
+        В событийном режиме цикл спит в pygame.event.wait, пока не придет ввод,
+        а во время перетаскивания просыпается не реже раза за кадр.
+        """
+        if not event_driven:
+            return pygame.event.get()
+        if self.is_animating():
+            event = pygame.event.wait(1000 // FPS)
+        else:
+            event = pygame.event.wait()
+        events = pygame.event.get()
+        if event.type != pygame.NOEVENT:
+            events.insert(0, event)
+        return events
+
+    def run(self, event_driven: bool = True, stats: Optional[LoopStats] = None) -> None:
+        """Основной игровой цикл.
+
+        event_driven=False возвращает прежний режим с опросом событий и
+        перерисовкой FPS раз в секунду. Если передан stats, в нем
+        накапливаются пробуждения цикла и выведенные кадры.
+        """
         running = True
         game_over = False
         show_message = False
+        message_shown = False
         message_text = ""
+        checked_version = -1
+
+        # Первый кадр - пустое сукно: окно показывается сразу, а поверхности
+        # карт строятся при первой отрисовке партии
+        self.screen.fill(GREEN)
+        pygame.display.flip()
 
         while running:
-            for event in pygame.event.get():
+            # Профайлер может появиться или исчезнуть по F3; без него замеров нет
+            profiler = self.profiler
+            events = self.wait_events(event_driven)
+            if stats:
+                stats.wakeups += 1
+            if profiler:
+                profiler.mark('wait')
+
+            for event in events:
                 if event.type == pygame.QUIT:
                     running = False
+                elif event.type == pygame.VIDEOEXPOSE:
+                    self.invalidate()
+                elif event.type == pygame.VIDEORESIZE:
+                    self.resize()
+                elif event.type == HINT_EVENT:
+                    self.show_hint(event.hint)
                 elif event.type == pygame.MOUSEBUTTONDOWN and not game_over:
                     if event.button == 1:  # Левая кнопка мыши
                         self.handle_click(event.pos)
+                    elif event.button == 3:  # Правая - все, что можно, в фундамент
+                        self.auto_move()
                 elif event.type == pygame.MOUSEBUTTONUP and not game_over:
-                    if event.button == 1 and self.selected_cards:
+                    if event.button == 1 and self.selection:
                         self.handle_drop(event.pos)
                 elif event.type == pygame.MOUSEMOTION and not game_over:
-                    if self.selected_cards and self.drag_pos:
-                        self.drag_pos = (event.pos[0] - CARD_WIDTH//2,
-                                         event.pos[1] - CARD_HEIGHT//2)
+                    if self.selection and self.drag_pos:
+                        self.drag_pos = (event.pos[0] - layout.card_width // 2,
+                                         event.pos[1] - layout.card_height // 2)
+                elif event.type == pygame.KEYDOWN and event.mod & pygame.KMOD_CTRL:
+                    # Ctrl+Z - отменить ход, Ctrl+Y или Ctrl+Shift+Z - повторить
+                    redo = event.key == pygame.K_y or (event.key == pygame.K_z and
+                                                       event.mod & pygame.KMOD_SHIFT)
+                    if redo:
+                        changed = self.redo()
+                    else:
+                        changed = event.key == pygame.K_z and self.undo()
+                    if changed and show_message:
+                        # Убираем сообщение о конце игры
+                        game_over = False
+                        show_message = False
+                        self.invalidate()
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.toggle_profile()
                 elif event.type == pygame.KEYDOWN and show_message:
                     if event.key == pygame.K_y:
                         self.reset_game()
                         game_over = False
                         show_message = False
+                        checked_version = -1
                     elif event.key == pygame.K_n:
                         running = False
-
-            # Основная отрисовка игры
-            self.draw_game()
-
-            # Проверяем условия конца игры (только если не в режиме сообщения)
-            if not game_over and not show_message:
-                if self.check_win():
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_h:
+                    self.request_hint()
+            if profiler:
+                profiler.mark('events')
+
+            # Основная отрисовка игры (только изменившиеся области)
+            repainted = self.draw_game()
+            if stats and repainted:
+                stats.frames += 1
+            if profiler:
+                # draw_game сам отмечает отрисовку перед выводом на экран
+                profiler.mark('present' if repainted else 'draw')
+
+            # Проверяем условия конца игры только после изменения состояния
+            if not game_over and not show_message and checked_version != self.state_version:
+                checked_version = self.state_version
+                if self.game.check_win():
                     message_text = "Поздравляем! Вы выиграли! Начать заново? (Y/N)"
                     game_over = True
                     show_message = True
-                elif not self.has_possible_moves():
+                    message_shown = False
+                    if self.animator:
+                        self.win_cascade()
+                elif not self.game.has_progress_move():
                     message_text = "Нет возможных ходов! Начать заново? (Y/N)"
                     game_over = True
                     show_message = True
-
-            # Показываем сообщение (если нужно)
-            if show_message:
-                self.show_message(message_text)
-
-            self.clock.tick(60)
-
+                    message_shown = False
+            if profiler:
+                profiler.mark('rules')
+
+            # Показываем сообщение при появлении и после перерисовки под ним,
+            # когда карты долетели
+            if show_message and (repainted or not message_shown) and not self.flying:
+                # После частичной перерисовки затемняем только перерисованное
+                self.show_message(message_text,
+                                  self.updated_rects if message_shown and repainted else None)
+                message_shown = True
+            if profiler:
+                profiler.mark('message')
+
+            if not event_driven or self.is_animating():
+                self.clock.tick(FPS)
+            if profiler:
+                profiler.mark('tick')
+                profiler.end_frame(repainted)
+
+        self.save_replay()
+        self.hints.close()
+        if self.profiler:
+            self.profiler.close()
         pygame.quit()
 
 
 if __name__ == "__main__":
-    game = Solitaire()
-    game.run()
+    parser = argparse.ArgumentParser(description="Косынка")
+    parser.add_argument('--busy', action='store_true',
+                        help="опрашивать события и перерисовывать кадр FPS раз в секунду")
+    parser.add_argument('--stats', action='store_true',
+                        help="при выходе вывести число пробуждений цикла и загрузку CPU")
+    parser.add_argument('--seed', type=parse_seed, help="номер расклада (по умолчанию - случайный)")
+    parser.add_argument('--replay', help="дописывать сыгранные партии в этот архив записей")
+    parser.add_argument('--deals', metavar='FILE',
+                        help="брать расклады из библиотеки решаемых раскладов (deals.py)")
+    parser.add_argument('--difficulty', choices=DIFFICULTIES,
+                        help="сложность раскладов из библиотеки (по умолчанию - любая)")
+    parser.add_argument('--profile-trace', metavar='FILE',
+                        help="замерять фазы главного цикла и писать их по кадрам в CSV-файл")
+    parser.add_argument('--fullscreen', action='store_true',
+                        help="во весь экран (стол масштабируется под разрешение)")
+    parser.add_argument('--no-animation', action='store_true',
+                        help="без анимации: карты сразу появляются на новых местах")
+    args = parser.parse_args()
+
+    loop_stats = LoopStats() if args.stats else None
+    library = DealLibrary(args.deals) if args.deals else None
+    game = Solitaire(args.seed, args.replay, args.profile_trace, library, args.difficulty,
+                     args.fullscreen, animate=not args.no_animation)
+    game.run(event_driven=not args.busy, stats=loop_stats)
+    if loop_stats:
+        print(loop_stats.report())
+    if game.profiler:
+        print('\n'.join(game.profiler.report_lines()))
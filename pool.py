@@ -0,0 +1,66 @@
+"""Общее для пакетных расчетов simulate.py, deals.py и replay.py.
+
+run_pool выполняет задания в пуле процессов, не создавая их все заранее;
+parse_seed и parse_range разбирают seed и диапазон seed из командной
+строки. Пул процессов
+загружается только при вызове run_pool: игра импортирует deals и replay
+ради библиотеки раскладов и записи партий.
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+# Seed в записях партий, библиотеке раскладов и результатах - uint32
+SEED_LIMIT = 1 << 32
+
+
+def run_pool(func: Callable[..., Any], tasks: Iterable[tuple], workers: Optional[int] = None,
+             progress: Optional[Callable[[float], str]] = None) -> Iterator[Tuple[tuple, Any]]:
+    """Выполняет func(*task) для каждого задания в пуле процессов.
+
+    Выдает пары (задание, результат) в порядке готовности. Задания берутся
+    из tasks по мере освобождения процессов, так что их можно порождать
+    лениво. Если передан progress, после каждой порции результатов в stderr
+    выводится его строка; аргумент - секунды с начала расчета.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    workers = workers or os.cpu_count() or 1
+    tasks = iter(tasks)
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        while True:
+            # Держим в работе по два задания на процесс
+            while len(pending) < 2 * workers:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                pending[pool.submit(func, *task)] = task
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield pending.pop(future), future.result()
+            if progress:
+                print(progress(time.perf_counter() - started), file=sys.stderr)
+
+
+def parse_seed(text: str) -> int:
+    """Номер расклада: 0 <= seed < SEED_LIMIT."""
+    seed = int(text)
+    if not 0 <= seed < SEED_LIMIT:
+        raise argparse.ArgumentTypeError(f"seed должен быть от 0 до {SEED_LIMIT - 1}: {seed}")
+    return seed
+
+
+def parse_range(text: str) -> Tuple[int, int]:
+    """Диапазон seed вида 'first:last' (last не включается)."""
+    first, last = text.split(':')
+    first, last = parse_seed(first), int(last)
+    if not first <= last <= SEED_LIMIT:
+        raise argparse.ArgumentTypeError(f"неверный диапазон seed: {text}")
+    return first, last
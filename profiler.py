@@ -0,0 +1,95 @@
+"""Замер фаз главного цикла интерфейса.
+
+FrameProfiler делит каждую итерацию цикла на фазы (ожидание событий,
+обработка событий, отрисовка, вывод на экран, проверка конца игры,
+сообщение, ожидание кадра) и замеряет их через time.perf_counter_ns.
+По последним кадрам считаются процентили p50/p95/p99, которые показывает
+оверлей интерфейса. Если задан файл трассировки, в него пишется строка на
+каждую итерацию цикла (CSV, времена в микросекундах).
+
+Модуль не зависит от pygame. Когда замер выключен, профайлер не создается
+и цикл проверяет только ссылку на него.
+"""
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, TextIO, Tuple
+
+# Фазы итерации цикла в порядке выполнения
+PHASES = ('wait', 'events', 'draw', 'present', 'rules', 'message', 'tick')
+
+# Фазы простоя: в работу кадра не входят
+IDLE_PHASES = ('wait', 'tick')
+
+# Сколько последних кадров учитывается в процентилях
+WINDOW = 600
+
+# Как часто обновляются строки оверлея, нс
+OVERLAY_PERIOD_NS = 250_000_000
+
+
+def percentile(ordered: List[int], share: float) -> int:
+    """Процентиль упорядоченного списка (ближайший ранг)."""
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+class FrameProfiler:
+    """Времена фаз главного цикла, процентили по окну кадров и трассировка."""
+
+    def __init__(self, trace_path: Optional[str] = None, window: int = WINDOW):
+        self.history: Dict[str, Deque[int]] = {phase: deque(maxlen=window)
+                                               for phase in (*PHASES, 'busy')}
+        self.current = dict.fromkeys(PHASES, 0)
+        self.frames = 0
+        self.last = time.perf_counter_ns()
+        self.overlay_lines: Tuple[str, ...] = ()
+        self.overlay_time = 0
+        self.trace: Optional[TextIO] = None
+        if trace_path:
+            self.trace = open(trace_path, 'w')
+            self.trace.write(','.join(('frame', 'repainted', *PHASES, 'busy')) + '\n')
+
+    def mark(self, phase: str) -> None:
+        """Относит время с предыдущей отметки к фазе phase."""
+        now = time.perf_counter_ns()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def end_frame(self, repainted: bool) -> None:
+        """Завершает итерацию цикла: окно процентилей, трассировка, оверлей."""
+        current = self.current
+        busy = sum(current.values()) - sum(current[phase] for phase in IDLE_PHASES)
+        for phase, elapsed in current.items():
+            self.history[phase].append(elapsed)
+        self.history['busy'].append(busy)
+        if self.trace:
+            fields = [str(elapsed // 1000) for elapsed in current.values()]
+            self.trace.write(f"{self.frames},{int(repainted)},{','.join(fields)},"
+                             f"{busy // 1000}\n")
+        self.frames += 1
+        self.current = dict.fromkeys(PHASES, 0)
+        if self.last - self.overlay_time >= OVERLAY_PERIOD_NS:
+            self.overlay_time = self.last
+            self.overlay_lines = self.report_lines()
+
+    def percentiles(self, phase: str) -> Tuple[int, int, int]:
+        """p50, p95 и p99 времени фазы по окну кадров, нс."""
+        ordered = sorted(self.history[phase])
+        return (percentile(ordered, 0.50), percentile(ordered, 0.95),
+                percentile(ordered, 0.99))
+
+    def report_lines(self) -> Tuple[str, ...]:
+        """Строки таблицы процентилей (мс) по фазам."""
+        lines = [f"{'phase':8}{'p50':>8}{'p95':>8}{'p99':>8}"]
+        for phase in ('busy', *PHASES):
+            p50, p95, p99 = self.percentiles(phase)
+            lines.append(f"{phase:8}{p50 / 1e6:8.2f}{p95 / 1e6:8.2f}{p99 / 1e6:8.2f}")
+        lines.append(f"frames {self.frames}")
+        return tuple(lines)
+
+    def close(self) -> None:
+        """Закрывает файл трассировки."""
+        if self.trace:
+            self.trace.close()
+            self.trace = None
@@ -0,0 +1,261 @@
+"""Записи партий и проверка архивов записей.
+
+Партия однозначно задается seed раздачи (engine.shuffled_deck) и списком
+ходов, поэтому запись хранит только их:
+
+    заголовок архива: b'SLRP', версия (uint8)
+    запись: seed (uint32), карт в фундаменте в конце партии (uint8),
+            число ходов (uint16), затем коды ходов (engine.move_code, uint16)
+
+Проверка читает архив блоками целых записей, переигрывает партии движком в
+пуле процессов и сверяет допустимость ходов и итог партии. Память не
+зависит от размера архива: в работе держится по два блока на процесс.
+
+Запуск:
+    python replay.py record --seeds 0:100000 --out greedy.slrp
+    python replay.py validate greedy.slrp --workers 4
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+from array import array
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple
+
+from engine import (Game, History, Move, DEAL, FOUNDATION, SOURCES, RANKS, MOVE_CODE_MASK,
+                    delta_move, move_code, shuffled_deck)
+from pool import parse_range, run_pool
+
+FILE_MAGIC = b'SLRP'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<4sB')
+RECORD_HEADER = struct.Struct('<IBH')
+
+# Размер блока, читаемого из архива и отдаваемого процессу пула
+BLOCK_BYTES = 1 << 20
+
+# Сколько ошибок с номерами записей сохранять в итогах
+MAX_ERRORS = 20
+
+# VALID_CODES[code] == 1 для кодов ходов, которые могут быть допустимы
+VALID_CODES = bytearray(MOVE_CODE_MASK + 1)
+VALID_CODES[move_code(DEAL)] = 1
+for _src in SOURCES:
+    for _dst in [*range(7), FOUNDATION]:
+        for _count in range(1, len(RANKS) + 1):
+            VALID_CODES[move_code(Move(_src, _count, _dst))] = 1
+
+
+class Replay(NamedTuple):
+    """Запись партии."""
+    seed: int
+    foundation: int  # карт в фундаменте в конце партии
+    moves: array     # коды ходов, array('H')
+
+
+def replay_of(seed: int, game: Game, history: History) -> Replay:
+    """Запись партии по ее журналу ходов."""
+    moves = array('H', (delta & MOVE_CODE_MASK for delta in history.done))
+    return Replay(seed, sum(game.foundations), moves)
+
+
+def write_header(stream: BinaryIO) -> None:
+    stream.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION))
+
+
+def write_replay(stream: BinaryIO, replay: Replay) -> None:
+    """Дописывает запись в архив."""
+    stream.write(RECORD_HEADER.pack(replay.seed, replay.foundation, len(replay.moves)))
+    replay.moves.tofile(stream)
+
+
+def append_replay(path: str, replay: Replay) -> None:
+    """Дописывает запись в архив path, создавая его при необходимости."""
+    with open(path, 'ab') as stream:
+        if not stream.tell():
+            write_header(stream)
+        write_replay(stream, replay)
+
+
+def open_archive(path: str) -> BinaryIO:
+    """Открывает архив для чтения и пропускает заголовок."""
+    stream = open(path, 'rb')
+    header = stream.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size or FILE_HEADER.unpack(header)[0] != FILE_MAGIC:
+        stream.close()
+        raise ValueError(f"{path}: не архив записей партий")
+    return stream
+
+
+def record_bounds(data: bytes) -> Tuple[int, int]:
+    """Конец последней целой записи в data и число целых записей."""
+    offset = count = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        moves = RECORD_HEADER.unpack_from(data, offset)[2]
+        end = offset + RECORD_HEADER.size + 2 * moves
+        if end > len(data):
+            break
+        offset = end
+        count += 1
+    return offset, count
+
+
+def iter_blocks(stream: BinaryIO, block_bytes: int = BLOCK_BYTES) -> Iterator[Tuple[int, bytes]]:
+    """Делит поток записей на блоки целых записей: (номер первой записи, байты).
+
+    Недописанная последняя запись возвращается отдельным блоком с номером -1.
+    """
+    number = 0
+    tail = b''
+    while True:
+        data = stream.read(block_bytes)
+        buffer = tail + data if tail else data
+        end, count = record_bounds(buffer)
+        if count:
+            yield number, buffer[:end]
+            number += count
+        tail = buffer[end:]
+        if not data:
+            if tail:
+                yield -1, tail
+            return
+
+
+def iter_replays(data: bytes) -> Iterator[Replay]:
+    """Записи блока из целых записей."""
+    offset = 0
+    while offset < len(data):
+        seed, foundation, count = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        moves = array('H')
+        moves.frombytes(data[offset:offset + 2 * count])
+        offset += 2 * count
+        yield Replay(seed, foundation, moves)
+
+
+def check_replay(replay: Replay) -> Optional[str]:
+    """Переигрывает партию; возвращает описание ошибки или None."""
+    game = Game(shuffled_deck(replay.seed))
+    for i, code in enumerate(replay.moves):
+        if code > MOVE_CODE_MASK or not VALID_CODES[code]:
+            return f"move {i}: bad code {code:#x}"
+        if not game.apply(delta_move(code)):
+            return f"move {i}: illegal {delta_move(code)}"
+    foundation = sum(game.foundations)
+    if foundation != replay.foundation:
+        return f"outcome: {foundation} foundation cards, recorded {replay.foundation}"
+    return None
+
+
+class BlockResult(NamedTuple):
+    """Итоги проверки блока записей."""
+    games: int
+    won: int
+    moves: int
+    errors: List[Tuple[int, int, str]]  # номер записи, seed, ошибка
+
+
+def validate_block(first: int, data: bytes) -> BlockResult:
+    """Проверяет блок записей (выполняется в процессе пула)."""
+    games = won = moves = 0
+    errors = []
+    for number, replay in enumerate(iter_replays(data), first):
+        games += 1
+        moves += len(replay.moves)
+        error = check_replay(replay)
+        if error:
+            errors.append((number, replay.seed, error))
+        elif replay.foundation == 4 * len(RANKS):
+            won += 1
+    return BlockResult(games, won, moves, errors)
+
+
+class Validation:
+    """Итоги проверки архива, накапливаемые по мере поступления блоков."""
+
+    def __init__(self):
+        self.games = 0
+        self.won = 0
+        self.moves = 0
+        self.invalid = 0
+        self.errors: List[Tuple[int, int, str]] = []
+        self.truncated = False
+
+    def add(self, result: BlockResult) -> None:
+        self.games += result.games
+        self.won += result.won
+        self.moves += result.moves
+        self.invalid += len(result.errors)
+        self.errors.extend(result.errors[:MAX_ERRORS - len(self.errors)])
+
+    def report(self) -> str:
+        lines = [f"games {self.games}, invalid {self.invalid}, won {self.won}, moves {self.moves}"]
+        lines += [f"record {number} (seed {seed}): {error}" for number, seed, error in self.errors]
+        if self.truncated:
+            lines.append("archive ends with a truncated record")
+        return '\n'.join(lines)
+
+
+def validate(path: str, workers: Optional[int] = None, block_bytes: int = BLOCK_BYTES,
+             progress: bool = False) -> Validation:
+    """Проверяет архив записей в пуле процессов."""
+    validation = Validation()
+
+    def blocks(stream: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+        for first, data in iter_blocks(stream, block_bytes):
+            if first < 0:
+                validation.truncated = True
+                continue
+            yield first, data
+
+    def report(elapsed: float) -> str:
+        return (f"games {validation.games}, invalid {validation.invalid}, "
+                f"{validation.games / elapsed:.0f} games/s")
+
+    with open_archive(path) as stream:
+        for _, result in run_pool(validate_block, blocks(stream), workers,
+                                  report if progress else None):
+            validation.add(result)
+    return validation
+
+
+def record(first: int, last: int, out: str, policy: str = 'greedy') -> int:
+    """Записывает партии раскладов first..last - 1, сыгранные стратегией policy."""
+    from simulate import play
+
+    with open(out, 'wb') as stream:
+        write_header(stream)
+        for seed in range(first, last):
+            game = Game(shuffled_deck(seed))
+            history = History()
+            play(game, policy, random.Random(seed), history)
+            write_replay(stream, replay_of(seed, game, history))
+    return last - first
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Записи партий 'Косынки'")
+    commands = parser.add_subparsers(dest='command', required=True)
+    record_parser = commands.add_parser('record', help="записать партии стратегии в архив")
+    record_parser.add_argument('--seeds', type=parse_range, default=(0, 1000),
+                               help="диапазон seed first:last")
+    record_parser.add_argument('--policy', choices=('greedy', 'random'), default='greedy')
+    record_parser.add_argument('--out', required=True, help="файл архива")
+    validate_parser = commands.add_parser('validate', help="переиграть и проверить архив")
+    validate_parser.add_argument('path', help="файл архива")
+    validate_parser.add_argument('--workers', type=int,
+                                 help="число процессов (по умолчанию - все ядра)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        count = record(*args.seeds, args.out, args.policy)
+        print(f"{count} games, {os.path.getsize(args.out)} bytes")
+    else:
+        validation = validate(args.path, args.workers, progress=True)
+        print(validation.report())
+        sys.exit(1 if validation.invalid or validation.truncated else 0)
+
+
+if __name__ == '__main__':
+    main()
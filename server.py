@@ -0,0 +1,379 @@
+"""Сервер партий 'Косынки' на asyncio.
+
+Один процесс ведет тысячи партий без pygame: клиенты (веб-интерфейс, боты)
+присылают ходы через TCP или Unix-сокет в двоичном протоколе. Партия
+хранится в памяти компактной записью позиции (не больше 94 байт) и
+разворачивается в engine.Game только на время хода. Партии, к которым
+давно не обращались, выгружаются в файл на диске (dbm) и загружаются
+обратно при следующем запросе; при остановке сервера выгружаются все.
+
+Протокол - сообщения фиксированного формата (little-endian):
+
+    запрос: операция (uint8), номер партии (uint32), аргумент (uint32)
+    ответ:  статус (uint8), номер партии (uint32), длина данных (uint16), данные
+
+Операции: NEW - новая партия с seed из аргумента (номер партии в запросе
+не используется, в ответе - номер новой партии), MOVE - ход с кодом
+engine.move_code из аргумента, STATE - текущая позиция, CLOSE - завершить
+партию. Ответ на NEW и STATE содержит запись позиции, на MOVE - число карт
+в фундаменте. Запросы можно отправлять, не дожидаясь ответов: ответы
+приходят в порядке запросов.
+
+Запись позиции: seed (uint32), число ходов (uint16), затем запись
+Game.pack: карт в фундаменте по мастям (4 x uint8), закрытых карт в
+стопках tableau (7 x uint8), длины стопок tableau (7 x uint8), длины отбоя
+и стока (2 x uint8), хеши tableau и талона (2 x uint64, Game.rehash -
+чтобы не пересчитывать их при каждом ходе), затем карты стопок tableau
+снизу вверх, отбоя и стока (по байту).
+
+Запуск:
+    python server.py serve --port 8765 --store sessions.db
+    python server.py load --port 8765 --sessions 2000 --connections 50
+    python server.py load --sessions 2000    # со встроенным сервером
+"""
+import argparse
+import asyncio
+import dbm
+import os
+import random
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Set, Tuple
+
+from engine import Game, MOVE_CODE_MASK, delta_move, move_code, shuffled_deck
+from profiler import percentile
+from replay import VALID_CODES
+
+REQUEST = struct.Struct('<BII')
+RESPONSE = struct.Struct('<BIH')
+STATE_HEADER = struct.Struct('<IH')
+
+# Операции запросов
+OP_NEW = 1
+OP_MOVE = 2
+OP_STATE = 3
+OP_CLOSE = 4
+
+# Статусы ответов
+OK = 0
+ILLEGAL = 1      # ход недопустим
+NO_SESSION = 2   # нет такой партии
+BAD_REQUEST = 3  # неизвестная операция или код хода
+
+# Партии, к которым не обращались столько секунд, выгружаются на диск
+IDLE_TIMEOUT = 300.0
+
+# Как часто ищутся простаивающие партии, с
+SWEEP_PERIOD = 10.0
+
+# Сколько байт читать из сокета за раз
+READ_BYTES = 1 << 16
+
+
+def pack_state(seed: int, moves: int, game: Game) -> bytes:
+    """Компактная запись позиции партии."""
+    return STATE_HEADER.pack(seed, moves) + game.pack()
+
+
+def unpack_state(data: bytes) -> Tuple[int, int, Game]:
+    """Seed, число ходов и партия из записи позиции."""
+    seed, moves = STATE_HEADER.unpack_from(data)
+    return seed, moves, Game.unpack(data[STATE_HEADER.size:])
+
+
+class GameServer:
+    """Партии сервера: последние использованные в памяти, простаивающие - на диске.
+
+    Партии в памяти упорядочены по времени последнего обращения, поэтому
+    простаивающие находятся в начале словаря и выгружаются без перебора
+    остальных.
+    """
+
+    def __init__(self, store_path: str, idle_timeout: float = IDLE_TIMEOUT):
+        self.store = dbm.open(store_path, 'c')
+        self.idle_timeout = idle_timeout
+        # Номер партии -> (время последнего обращения, запись позиции)
+        self.sessions: 'OrderedDict[int, Tuple[float, bytes]]' = OrderedDict()
+        self.next_id = max((int(key) for key in self.store.keys()), default=0) + 1
+        self.evicted = 0
+        self.loaded = 0
+        # Задачи обслуживания открытых соединений
+        self.connections: Set[asyncio.Task] = set()
+
+    def handle(self, op: int, session: int, arg: int) -> Tuple[int, int, bytes]:
+        """Выполняет запрос; возвращает статус, номер партии и данные ответа."""
+        if op == OP_NEW:
+            session = self.next_id
+            self.next_id += 1
+            state = pack_state(arg, 0, Game(shuffled_deck(arg)))
+            self.put(session, state)
+            return OK, session, state
+
+        state = self.get(session)
+        if state is None:
+            return NO_SESSION, session, b''
+        if op == OP_STATE:
+            return OK, session, state
+        if op == OP_CLOSE:
+            del self.sessions[session]
+            return OK, session, b''
+        if op != OP_MOVE or arg > MOVE_CODE_MASK or not VALID_CODES[arg]:
+            return BAD_REQUEST, session, b''
+
+        seed, moves, game = unpack_state(state)
+        if not game.apply(delta_move(arg)):
+            return ILLEGAL, session, b''
+        self.put(session, pack_state(seed, min(moves + 1, 0xFFFF), game))
+        return OK, session, bytes((sum(game.foundations),))
+
+    def get(self, session: int) -> Optional[bytes]:
+        """Запись позиции партии (с диска, если партия была выгружена)."""
+        entry = self.sessions.get(session)
+        if entry is not None:
+            self.put(session, entry[1])
+            return entry[1]
+        key = str(session)
+        if key not in self.store:
+            return None
+        state = self.store[key]
+        del self.store[key]
+        self.loaded += 1
+        self.put(session, state)
+        return state
+
+    def put(self, session: int, state: bytes) -> None:
+        """Сохраняет позицию партии в памяти и отмечает обращение к ней."""
+        self.sessions[session] = (time.monotonic(), state)
+        self.sessions.move_to_end(session)
+
+    def evict_idle(self, idle_timeout: Optional[float] = None) -> int:
+        """Выгружает на диск партии, простаивающие дольше idle_timeout; возвращает их число."""
+        deadline = time.monotonic() - (self.idle_timeout if idle_timeout is None else idle_timeout)
+        count = 0
+        for session, (used, state) in self.sessions.items():
+            if used > deadline:
+                break
+            self.store[str(session)] = state
+            count += 1
+        for _ in range(count):
+            self.sessions.popitem(last=False)
+        self.evicted += count
+        return count
+
+    async def sweep(self) -> None:
+        """Периодически выгружает простаивающие партии."""
+        while True:
+            await asyncio.sleep(min(SWEEP_PERIOD, self.idle_timeout / 2))
+            self.evict_idle()
+
+    async def serve_connection(self, reader: asyncio.StreamReader,
+                               writer: asyncio.StreamWriter) -> None:
+        """Обслуживает соединение: все пришедшие целиком запросы - одной записью ответов."""
+        task = asyncio.current_task()
+        self.connections.add(task)
+        tail = b''
+        try:
+            while True:
+                data = await reader.read(READ_BYTES)
+                if not data:
+                    break
+                data = tail + data if tail else data
+                end = len(data) - len(data) % REQUEST.size
+                out = bytearray()
+                for op, session, arg in REQUEST.iter_unpack(memoryview(data)[:end]):
+                    status, session, payload = self.handle(op, session, arg)
+                    out += RESPONSE.pack(status, session, len(payload))
+                    out += payload
+                tail = data[end:]
+                writer.write(out)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def wait_connections(self) -> None:
+        """Ждет закрытия всех соединений."""
+        if self.connections:
+            await asyncio.wait(self.connections)
+
+    def close(self) -> None:
+        """Выгружает все партии на диск и закрывает хранилище."""
+        self.evict_idle(-1.0)
+        self.store.close()
+
+
+async def start(server: GameServer, host: str = '127.0.0.1', port: int = 0,
+                unix: Optional[str] = None) -> asyncio.AbstractServer:
+    """Начинает принимать соединения (port=0 - любой свободный порт)."""
+    if unix:
+        return await asyncio.start_unix_server(server.serve_connection, unix)
+    return await asyncio.start_server(server.serve_connection, host, port)
+
+
+class Client:
+    """Соединение с сервером: запрос и ожидание ответа."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def request(self, op: int, session: int = 0, arg: int = 0) -> Tuple[int, int, bytes]:
+        """Статус, номер партии и данные ответа."""
+        self.writer.write(REQUEST.pack(op, session, arg))
+        status, session, length = RESPONSE.unpack(await self.reader.readexactly(RESPONSE.size))
+        payload = await self.reader.readexactly(length) if length else b''
+        return status, session, payload
+
+    async def close(self) -> None:
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+class LoadResult(NamedTuple):
+    """Итоги нагрузочного теста."""
+    sessions: int
+    moves: int
+    elapsed: float
+    latencies: List[int]  # задержки ответов на ходы, нс
+    errors: int           # отказы в допустимых ходах и расхождения позиций
+
+    def report(self) -> str:
+        ordered = sorted(self.latencies)
+        p50, p99, p999 = (percentile(ordered, share) / 1e6 for share in (0.5, 0.99, 0.999))
+        return (f"sessions {self.sessions}, moves {self.moves}, "
+                f"{self.moves / self.elapsed:.0f} moves/s, latency p50 {p50:.2f} ms, "
+                f"p99 {p99:.2f} ms, p99.9 {p999:.2f} ms, "
+                f"max {(ordered[-1] if ordered else 0) / 1e6:.2f} ms, errors {self.errors}")
+
+
+async def load_connection(client: Client, seeds: range, moves: int, rng: random.Random,
+                          latencies: List[int], keep: bool = False) -> Tuple[int, int]:
+    """Играет партии seeds по очереди по одному ходу, сверяя позиции с копией у клиента.
+
+    Если keep, партии в конце не завершаются. Возвращает число сделанных
+    ходов и ошибок.
+    """
+    games = {}
+    played = errors = 0
+    for seed in seeds:
+        status, session, state = await client.request(OP_NEW, 0, seed)
+        game = Game(shuffled_deck(seed))
+        errors += status != OK or state != pack_state(seed, 0, game)
+        games[session] = [seed, 0, game]
+
+    for _ in range(moves):
+        for session, entry in games.items():
+            legal = entry[2].legal_moves()
+            if not legal:
+                continue
+            move = rng.choice(legal)
+            start = time.perf_counter_ns()
+            status, _, _ = await client.request(OP_MOVE, session, move_code(move))
+            latencies.append(time.perf_counter_ns() - start)
+            errors += status != OK
+            entry[2].apply(move)
+            entry[1] += 1
+            played += 1
+
+    for session, (seed, count, game) in games.items():
+        _, _, state = await client.request(OP_STATE, session)
+        errors += state != pack_state(seed, count, game)
+        if not keep:
+            await client.request(OP_CLOSE, session)
+    return played, errors
+
+
+async def load(host: str, port: int, sessions: int, connections: int, moves: int,
+               keep: bool = False, seed: int = 0) -> LoadResult:
+    """Нагрузочный тест: sessions партий через connections соединений, по moves ходов."""
+    clients = [Client(*await asyncio.open_connection(host, port)) for _ in range(connections)]
+    latencies: List[int] = []
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        load_connection(client, range(seed + k, seed + sessions, connections), moves,
+                        random.Random(seed + k), latencies, keep)
+        for k, client in enumerate(clients)))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+    return LoadResult(sessions, sum(played for played, _ in results), elapsed, latencies,
+                      sum(errors for _, errors in results))
+
+
+async def load_embedded(sessions: int, connections: int, moves: int, keep: bool,
+                        idle_timeout: float) -> LoadResult:
+    """Нагрузочный тест против сервера в том же процессе (хранилище во временном каталоге)."""
+    with tempfile.TemporaryDirectory() as directory:
+        server = GameServer(os.path.join(directory, 'sessions'), idle_timeout)
+        listener = await start(server)
+        sweeper = asyncio.ensure_future(server.sweep())
+        try:
+            result = await load('127.0.0.1', listener.sockets[0].getsockname()[1],
+                                sessions, connections, moves, keep)
+            await server.wait_connections()
+        finally:
+            sweeper.cancel()
+            listener.close()
+            await listener.wait_closed()
+            server.close()
+        return result
+
+
+async def serve(store: str, host: str, port: int, unix: Optional[str],
+                idle_timeout: float) -> None:
+    """Запускает сервер до прерывания."""
+    server = GameServer(store, idle_timeout)
+    listener = await start(server, host, port, unix)
+    sweeper = asyncio.ensure_future(server.sweep())
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        sweeper.cancel()
+        server.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Сервер партий 'Косынки'")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help="запустить сервер")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--unix', metavar='PATH', help="слушать Unix-сокет вместо TCP")
+    serve_parser.add_argument('--store', default='sessions.db',
+                              help="файл выгруженных партий")
+    load_parser = commands.add_parser('load', help="нагрузочный тест")
+    load_parser.add_argument('--host', default='127.0.0.1')
+    load_parser.add_argument('--port', type=int,
+                             help="порт сервера (по умолчанию - встроенный сервер)")
+    load_parser.add_argument('--sessions', type=int, default=1000)
+    load_parser.add_argument('--connections', type=int, default=20)
+    load_parser.add_argument('--moves', type=int, default=100, help="ходов в каждой партии")
+    load_parser.add_argument('--keep', action='store_true',
+                             help="не завершать партии (остаются на сервере)")
+    for command_parser in (serve_parser, load_parser):
+        command_parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT,
+                                    help="через сколько секунд простоя партия выгружается")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args.store, args.host, args.port, args.unix, args.idle_timeout))
+        except KeyboardInterrupt:
+            pass
+        return
+    if args.port:
+        result = asyncio.run(load(args.host, args.port, args.sessions, args.connections,
+                                  args.moves, args.keep))
+    else:
+        result = asyncio.run(load_embedded(args.sessions, args.connections, args.moves,
+                                           args.keep, args.idle_timeout))
+    print(result.report())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+"""Пакетная оценка выигрываемости раскладов методом Монте-Карло.
+
+Расклады задаются диапазоном seed (engine.shuffled_deck), играются выбранной
+стратегией (greedy, random или solver) в пуле процессов и записываются
+блоками в колоночный файл. Каждый блок - один кусок диапазона seed:
+
+    заголовок файла: b'SIMR', версия (uint8), стратегия (16 байт),
+                     бюджет узлов решателя (uint32, 0 для greedy и random)
+    блок: b'CHNK', первый seed (uint32), число раскладов (uint32),
+          затем колонки seed (uint32), result (uint8), moves (uint16),
+          foundation (uint8), nodes (uint32)
+
+Блок покрывает непрерывный диапазон seed. При повторном запуске уже
+посчитанные seed пропускаются (при любых --seeds и --chunk), поэтому
+прерванный расчет продолжается с места остановки, а расширенный диапазон
+досчитывается без повторов. Итоги считаются по мере поступления блоков.
+
+Запуск: python simulate.py --seeds 0:100000 --policy greedy --out greedy.simr
+"""
+import argparse
+import os
+import random
+import struct
+from array import array
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from engine import Game, History, Move, DEAL, DECK_SIZE, FOUNDATION, STOCK, WASTE, shuffled_deck
+from pool import parse_range, run_pool
+
+# Результат партии
+LOST = 0
+WON = 1
+UNDECIDED = 2  # решатель исчерпал бюджет
+
+FILE_MAGIC = b'SIMR'
+FILE_VERSION = 2
+FILE_HEADER = struct.Struct('<4sB16sI')
+CHUNK_MAGIC = b'CHNK'
+CHUNK_HEADER = struct.Struct('<4sII')
+
+# Колонки блока: имя и тип array
+COLUMNS = (('seed', 'I'), ('result', 'B'), ('moves', 'H'), ('foundation', 'B'), ('nodes', 'I'))
+
+# Предел ходов одной партии для greedy и random
+MAX_MOVES = 1000
+
+
+class ChunkResult(NamedTuple):
+    """Результаты куска диапазона seed по колонкам."""
+    start: int
+    columns: Dict[str, array]
+
+
+class Summary:
+    """Итоги, накапливаемые по мере поступления блоков."""
+
+    def __init__(self):
+        self.games = 0
+        self.won = 0
+        self.undecided = 0
+        self.moves = 0
+        self.foundation = 0
+
+    def add(self, columns: Dict[str, array]) -> None:
+        results = columns['result']
+        self.games += len(results)
+        self.won += results.count(WON)
+        self.undecided += results.count(UNDECIDED)
+        self.moves += sum(columns['moves'])
+        self.foundation += sum(columns['foundation'])
+
+    def report(self) -> str:
+        games = max(self.games, 1)
+        return (f"games {self.games}, won {self.won} ({self.won / games:.2%}), "
+                f"undecided {self.undecided}, avg moves {self.moves / games:.1f}, "
+                f"avg foundation cards {self.foundation / games:.1f}")
+
+
+def move_score(game: Game, move: Move) -> int:
+    """Оценка хода для жадной стратегии: меньше - лучше."""
+    if move.dst == FOUNDATION:
+        return 0
+    if move.src == WASTE:
+        return 2
+    pile = game.tableau[move.src]
+    return 1 if pile.hidden else 3
+
+
+def play(game: Game, policy: str, rng: random.Random, history: Optional[History] = None) -> int:
+    """Играет партию стратегией greedy или random; возвращает число ходов.
+
+    Обе стратегии делают только продвигающие ходы (Game.is_progress), а при
+    их отсутствии берут карту из стока. greedy выбирает лучший ход по
+    move_score, random - случайный. Партия заканчивается, если за два
+    полных прохода стока не нашлось ни одного продвигающего хода. Если
+    передан history, ходы записываются в него.
+    """
+    moves = 0
+    idle_deals = 0
+    while moves < MAX_MOVES and not game.check_win():
+        progress = [move for move in game.legal_moves()
+                    if move.src != STOCK and game.is_progress(move)]
+        if progress:
+            if policy == 'greedy':
+                move = min(progress, key=lambda m: move_score(game, m))
+            else:
+                move = rng.choice(progress)
+            idle_deals = 0
+        else:
+            if not (game.stock or game.waste):
+                break
+            idle_deals += 1
+            if idle_deals > 2 * (len(game.stock) + len(game.waste) + 1):
+                break
+            move = DEAL
+        if history is not None:
+            history.play(game, move)
+        else:
+            game.apply(move)
+        moves += 1
+    return moves
+
+
+def run_chunk(start: int, count: int, policy: str, solver_nodes: int) -> ChunkResult:
+    """Играет расклады start..start + count - 1 (выполняется в процессе пула)."""
+    columns = {name: array(code) for name, code in COLUMNS}
+    solver = None
+    if policy == 'solver':
+        from solver import Solver, SOLVED, UNKNOWN
+        solver = Solver(max_nodes=solver_nodes, time_limit=float('inf'))
+
+    for seed in range(start, start + count):
+        game = Game(shuffled_deck(seed))
+        nodes = 0
+        if solver is None:
+            moves = play(game, policy, random.Random(seed))
+            result = WON if game.check_win() else LOST
+            foundation = sum(game.foundations)
+        else:
+            solved = solver.solve(game)
+            nodes = solved.nodes
+            moves = len(solved.moves)
+            result = {SOLVED: WON, UNKNOWN: UNDECIDED}.get(solved.status, LOST)
+            foundation = DECK_SIZE if result == WON else sum(game.foundations)
+        columns['seed'].append(seed)
+        columns['result'].append(result)
+        columns['moves'].append(min(moves, 0xFFFF))
+        columns['foundation'].append(foundation)
+        columns['nodes'].append(min(nodes, 0xFFFFFFFF))
+    return ChunkResult(start, columns)
+
+
+def write_chunk(stream, chunk: ChunkResult) -> None:
+    """Дописывает блок в файл результатов."""
+    count = len(chunk.columns['seed'])
+    stream.write(CHUNK_HEADER.pack(CHUNK_MAGIC, chunk.start, count))
+    for name, _ in COLUMNS:
+        chunk.columns[name].tofile(stream)
+    stream.flush()
+
+
+def read_chunks(path: str) -> Iterator[ChunkResult]:
+    """Читает блоки файла результатов; недописанный хвост пропускается."""
+    with open(path, 'rb') as stream:
+        header = stream.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size:
+            return
+        magic, version, _, _ = FILE_HEADER.unpack(header)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise ValueError(f"{path}: не файл результатов или файл другой версии")
+        while True:
+            header = stream.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                return
+            magic, start, count = CHUNK_HEADER.unpack(header)
+            if magic != CHUNK_MAGIC:
+                return
+            columns = {}
+            for name, code in COLUMNS:
+                column = array(code)
+                try:
+                    column.fromfile(stream, count)
+                except EOFError:
+                    return
+                columns[name] = column
+            yield ChunkResult(start, columns)
+
+
+def open_output(path: str, policy: str,
+                solver_nodes: int) -> Tuple[object, List[Tuple[int, int]], Summary]:
+    """Открывает файл результатов для дозаписи.
+
+    Возвращает поток, уже посчитанные диапазоны seed (first, last) и итоги
+    по ним. Недописанный при прерывании блок отрезается. Файл другой
+    стратегии или другого бюджета решателя не дописывается.
+    """
+    done: List[Tuple[int, int]] = []
+    summary = Summary()
+    header = FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, policy.encode().ljust(16, b'\0'),
+                              solver_nodes if policy == 'solver' else 0)
+    if os.path.exists(path) and os.path.getsize(path) >= FILE_HEADER.size:
+        with open(path, 'rb') as stream:
+            if stream.read(FILE_HEADER.size) != header:
+                raise ValueError(f"{path}: файл другой стратегии, бюджета решателя или "
+                                 f"версии либо не файл результатов")
+        end = FILE_HEADER.size
+        for chunk in read_chunks(path):
+            count = len(chunk.columns['seed'])
+            done.append((chunk.start, chunk.start + count))
+            summary.add(chunk.columns)
+            end += CHUNK_HEADER.size + sum(count * array(code).itemsize for _, code in COLUMNS)
+        stream = open(path, 'r+b')
+        stream.truncate(end)
+        stream.seek(end)
+    else:
+        stream = open(path, 'wb')
+        stream.write(header)
+    return stream, done, summary
+
+
+def missing_ranges(first: int, last: int,
+                   done: List[Tuple[int, int]]) -> Iterator[Tuple[int, int]]:
+    """Части диапазона first..last - 1, не покрытые посчитанными диапазонами done."""
+    for start, end in sorted(done):
+        if start > first:
+            yield first, min(start, last)
+        first = max(first, end)
+        if first >= last:
+            return
+    if first < last:
+        yield first, last
+
+
+def simulate(first: int, last: int, policy: str = 'greedy', out: Optional[str] = None,
+             workers: Optional[int] = None, chunk_size: int = 1000,
+             solver_nodes: int = 20000, progress: bool = False) -> Summary:
+    """Играет расклады first..last - 1 в пуле процессов.
+
+    Результаты пишутся в out (если задан) блоками по chunk_size раскладов;
+    уже записанные seed повторно не считаются.
+    """
+    if policy not in ('greedy', 'random', 'solver'):
+        raise ValueError(f"неизвестная стратегия: {policy}")
+
+    stream, done, summary = (open_output(out, policy, solver_nodes) if out
+                             else (None, [], Summary()))
+    chunks = [(start, min(chunk_size, end - start))
+              for begin, end in missing_ranges(first, last, done)
+              for start in range(begin, end, chunk_size)]
+    resumed = summary.games
+
+    def report(elapsed: float) -> str:
+        return f"{summary.report()}, {(summary.games - resumed) / elapsed:.0f} games/s"
+
+    try:
+        tasks = ((start, count, policy, solver_nodes) for start, count in chunks)
+        for _, chunk in run_pool(run_chunk, tasks, workers, report if progress else None):
+            if stream:
+                write_chunk(stream, chunk)
+            summary.add(chunk.columns)
+    finally:
+        if stream:
+            stream.close()
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Оценка выигрываемости раскладов")
+    parser.add_argument('--seeds', type=parse_range, default=(0, 10000),
+                        help="диапазон seed first:last")
+    parser.add_argument('--policy', choices=('greedy', 'random', 'solver'), default='greedy')
+    parser.add_argument('--out', help="файл результатов (дописывается при повторном запуске)")
+    parser.add_argument('--workers', type=int, help="число процессов (по умолчанию - все ядра)")
+    parser.add_argument('--chunk', type=int, default=1000, help="раскладов в одном блоке")
+    parser.add_argument('--solver-nodes', type=int, default=20000,
+                        help="бюджет узлов решателя для стратегии solver")
+    parser.add_argument('--summary', action='store_true',
+                        help="только вывести итоги уже записанного файла --out")
+    args = parser.parse_args(argv)
+    if args.summary and not args.out:
+        parser.error("для --summary нужен файл результатов --out")
+
+    # Недоступный файл или файл другой стратегии, бюджета или версии - ошибка
+    # аргументов, а не сбой
+    try:
+        if args.summary:
+            summary = Summary()
+            for chunk in read_chunks(args.out):
+                summary.add(chunk.columns)
+        else:
+            summary = simulate(*args.seeds, args.policy, args.out, args.workers, args.chunk,
+                               args.solver_nodes, progress=True)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    print(summary.report())
+
+
+if __name__ == '__main__':
+    main()
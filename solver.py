@@ -0,0 +1,265 @@
+"""Решатель пасьянса 'Косынка'.
+
+Поиск в глубину по позициям движка (engine.Game) с таблицей транспозиций
+на 64-битных ключах Зобриста (Game.canonical_key), которые движок обновляет
+при каждом ходе. Сокращение перебора:
+
+- безопасные ходы в фундамент (на карту уже не может понадобиться
+  положить карту противоположного цвета) делаются без ветвления;
+- перенос короля на пустую стопку пробуется только для первой пустой
+  стопки, а позиции, отличающиеся перестановкой стопок tableau, имеют
+  один ключ: такие позиции равноценны;
+- сдачи из стока не перебираются по одной: ход "сдавать, пока карта X не
+  окажется наверху отбоя, и сыграть ее" заменяет всю серию сдач. При сдаче
+  по одной карте с неограниченным числом переворотов положение указателя
+  в стоке не влияет на достижимые позиции, поэтому в ключ входит только
+  порядок карт стока и отбоя.
+
+Если перебор завершился без выигрыша в пределах бюджета, расклад
+доказанно нерешаем.
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from engine import (Game, Move, DEAL, SOURCES, WASTE, FOUNDATION, STOCK,
+                    CARD_RANK, CARD_RED, RANKS, SUITS, shuffled_deck)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Итоги решения
+SOLVED = 'solved'
+UNWINNABLE = 'unwinnable'
+UNKNOWN = 'unknown'
+
+SUIT_RED = [CARD_RED[suit * len(RANKS)] for suit in range(len(SUITS))]
+
+# Приоритеты ходов: меньшие пробуются раньше
+PRIORITY_FOUNDATION = 0
+PRIORITY_REVEAL = 1
+PRIORITY_WASTE = 2
+PRIORITY_TALON = 3
+PRIORITY_SHUFFLE = 4
+
+
+class SolveResult(NamedTuple):
+    """Результат решения расклада."""
+    status: str          # SOLVED, UNWINNABLE или UNKNOWN (исчерпан бюджет)
+    moves: List[Move]    # решение: ходы движка, включая сдачи из стока
+    nodes: int           # число рассмотренных позиций
+    elapsed: float       # время поиска, с
+    table_size: int      # число позиций в таблице транспозиций
+    peak_memory_kb: int  # пик памяти процесса (или поиска при track_memory)
+
+    @property
+    def nodes_per_s(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+
+def talon_sequence(game: Game) -> bytes:
+    """Карты стока и отбоя в порядке сдачи (не меняется при сдаче)."""
+    return bytes(game.waste) + bytes(reversed(game.stock))
+
+
+def is_safe_to_foundation(game: Game, card: int) -> bool:
+    """Безопасен ли ход карты в фундамент.
+
+    Карта ранга r нужна в tableau только как основа для карт ранга r - 1
+    противоположного цвета. Если они уже в фундаменте, ход в фундамент не
+    может помешать решению.
+    """
+    rank = CARD_RANK[card]
+    red = CARD_RED[card]
+    return all(count >= rank for suit, count in enumerate(game.foundations) if SUIT_RED[suit] != red)
+
+
+def deals_to_reach(game: Game, card: int) -> int:
+    """Сколько сдач нужно, чтобы карта стока или отбоя оказалась наверху отбоя."""
+    waste, stock = game.waste, game.stock
+    if waste and waste[-1] == card:
+        return 0
+    idx = stock.find(card)
+    if idx >= 0:
+        return len(stock) - idx
+    # Сток кончится, отбой перевернется, и карта выйдет после idx + 1 сдач
+    return len(stock) + 1 + waste.find(card) + 1
+
+
+def finish(game: Game) -> List[Move]:
+    """Доигрывает позицию, где все карты открыты, а сток и отбой пусты.
+
+    Младшая из оставшихся карт всегда лежит сверху своей стопки, поэтому
+    ходов в фундамент хватает до конца партии.
+    """
+    moves = []
+    while not game.check_win():
+        for src in range(7):
+            cards = game.tableau[src].cards
+            if cards and game.can_move_to_foundation(cards[-1]):
+                game.move_to_foundation(src)
+                moves.append(Move(src, 1, FOUNDATION))
+    return moves
+
+
+class Solver:
+    """Поиск решения расклада в пределах бюджета узлов и времени."""
+
+    def __init__(self, max_nodes: int = 1_000_000, time_limit: float = 30.0,
+                 track_memory: bool = False):
+        self.max_nodes = max_nodes
+        self.time_limit = time_limit
+        self.track_memory = track_memory
+
+    def expand(self, game: Game) -> List[List[Move]]:
+        """Ходы из позиции в порядке приоритета.
+
+        Каждый ход - серия ходов движка: сдачи из стока завершаются игрой
+        карты из отбоя.
+        """
+        # Безопасный ход в фундамент делается без ветвления
+        for src in SOURCES:
+            if game.movable_count(src):
+                card = game.top_cards(src)[-1]
+                if game.can_move_to_foundation(card) and is_safe_to_foundation(game, card):
+                    return [[Move(src, 1, FOUNDATION)]]
+
+        tableau = game.tableau
+        first_empty = next((i for i, pile in enumerate(tableau) if not pile.cards), None)
+        lines: List[Tuple[int, List[Move]]] = []
+
+        for move in game.legal_moves():
+            src, count, dst = move
+            if src == STOCK:
+                continue
+            if dst == FOUNDATION:
+                priority = PRIORITY_FOUNDATION
+            elif src == WASTE:
+                if not tableau[dst].cards and dst != first_empty:
+                    continue
+                priority = PRIORITY_WASTE
+            else:
+                pile = tableau[src]
+                whole_run = count == len(pile.cards) - pile.hidden
+                if not tableau[dst].cards:
+                    # Король уже лежит на пустом месте, или пустая стопка не первая
+                    if dst != first_empty or count == len(pile.cards):
+                        continue
+                priority = PRIORITY_REVEAL if whole_run and pile.hidden else PRIORITY_SHUFFLE
+            lines.append((priority, [move]))
+
+        # Карты глубже в стоке и отбое: сдать до них и сыграть
+        for card in talon_sequence(game):
+            deals = deals_to_reach(game, card)
+            if not deals:
+                continue  # верхняя карта отбоя уже учтена в legal_moves
+            prefix = [DEAL] * deals
+            if game.can_move_to_foundation(card):
+                lines.append((PRIORITY_FOUNDATION, prefix + [Move(WASTE, 1, FOUNDATION)]))
+            for dst in range(7):
+                if game.can_move_to_tableau(card, dst):
+                    if tableau[dst].cards or dst == first_empty:
+                        lines.append((PRIORITY_TALON, prefix + [Move(WASTE, 1, dst)]))
+
+        lines.sort(key=lambda line: line[0])
+        return [line for _, line in lines]
+
+    def solve(self, game: Game, cancelled: Optional[Callable[[], bool]] = None) -> SolveResult:
+        """Ищет решение расклада; исходная партия не меняется.
+
+        cancelled проверяется вместе со временем; если он вернул True, поиск
+        прерывается с итогом UNKNOWN.
+        """
+        if self.track_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        deadline = start + self.time_limit
+
+        root = game.copy()
+        seen = {root.canonical_key()}
+        nodes = 1
+        status = UNWINNABLE
+        solution: List[Move] = []
+
+        # Стек: позиция и еще не испробованные ходы из нее; path - ходы до нее
+        stack = [(root, iter(self.expand(root)))]
+        path: List[List[Move]] = []
+        while stack:
+            if nodes >= self.max_nodes or (nodes & 255 == 0 and (
+                    time.perf_counter() > deadline or (cancelled and cancelled()))):
+                status = UNKNOWN
+                break
+
+            state, lines = stack[-1]
+            line = next(lines, None)
+            if line is None:
+                stack.pop()
+                if path:
+                    path.pop()
+                continue
+
+            child = state.copy()
+            for move in line:
+                child.apply(move)
+            key = child.canonical_key()
+            if key in seen:
+                continue
+            seen.add(key)
+            nodes += 1
+            path.append(line)
+
+            if not child.stock and not child.waste and not any(pile.hidden for pile in child.tableau):
+                status = SOLVED
+                solution = [move for line in path for move in line] + finish(child)
+                break
+            stack.append((child, iter(self.expand(child))))
+
+        elapsed = time.perf_counter() - start
+        if self.track_memory:
+            peak_memory_kb = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+        elif resource is not None:
+            peak_memory_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        else:
+            peak_memory_kb = 0
+        return SolveResult(status, solution, nodes, elapsed, len(seen), peak_memory_kb)
+
+
+def solve(game: Game, max_nodes: int = 1_000_000, time_limit: float = 30.0) -> SolveResult:
+    """Решает расклад с заданным бюджетом узлов и времени."""
+    return Solver(max_nodes, time_limit).solve(game)
+
+
+def verify(game: Game, moves: List[Move]) -> bool:
+    """Проверяет, что ходы допустимы и приводят к выигрышу."""
+    game = game.copy()
+    return all(game.apply(move) for move in moves) and game.check_win()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Решатель пасьянса 'Косынка'")
+    parser.add_argument('--seed', type=int, default=0, help="номер первого расклада")
+    parser.add_argument('--count', type=int, default=1, help="сколько раскладов решить")
+    parser.add_argument('--max-nodes', type=int, default=1_000_000, help="бюджет узлов")
+    parser.add_argument('--time-limit', type=float, default=30.0, help="бюджет времени, с")
+    parser.add_argument('--track-memory', action='store_true',
+                        help="измерять пик памяти поиска через tracemalloc (медленнее)")
+    args = parser.parse_args(argv)
+
+    solver = Solver(args.max_nodes, args.time_limit, args.track_memory)
+    for seed in range(args.seed, args.seed + args.count):
+        game = Game(shuffled_deck(seed))
+        result = solver.solve(game)
+        line = (f"seed {seed}: {result.status}, nodes {result.nodes}, "
+                f"{result.nodes_per_s:.0f} nodes/s, {result.elapsed:.2f} s, "
+                f"table {result.table_size}, peak memory {result.peak_memory_kb} KB")
+        if result.status == SOLVED:
+            line += f", {len(result.moves)} moves, verified {verify(game, result.moves)}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()